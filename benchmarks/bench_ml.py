@@ -0,0 +1,329 @@
+"""
+Benchmark del modelo IA (PredictorRiesgo y entrenar_modelo)
+===========================================================
+Genera estudiantes sintéticos en una BD SQLite temporal (no toca la BD configurada) y mide,
+para cada camino de inferencia:
+
+  carga_s              → tiempo en construir PredictorRiesgo (cargar el modelo).
+  individual_p50/p99   → latencia de un estudiante por el camino actual (predecir_lote_detalle
+                         de un solo id, lo que ejecutan predecir_estudiante y el coalescedor
+                         de la vista), sin feature store, en ms.
+  original_p50/p99     → solo en pkl_denso: latencia del predecir_estudiante original (una
+                         consulta por estudiante + DataFrame + toarray + predict), el costo del
+                         recálculo por guardado de la señal desactivada en sat/signals.py, en ms.
+  lote_frio            → estudiantes/s de predecir_lote_detalle vectorizando desde la BD.
+  lote_caliente        → estudiantes/s con el feature store ya poblado.
+  rss_max_mb           → memoria residente máxima del proceso.
+
+Caminos:
+  artefacto     → motor NumPy desde sat/ml_models/modelo_sat.npz/.json (el de producción).
+  pkl_disperso  → scikit-learn desde el .pkl, TF-IDF en CSR.
+  pkl_denso     → scikit-learn desde el .pkl, toarray() + concatenate (camino original).
+
+Y para el entrenamiento (manage.py entrenar_modelo sobre la misma BD, artefacto a un temporal):
+
+  entrenar_s           → tiempo total del comando.
+  rss_max_mb           → memoria residente máxima del proceso.
+
+  entrenamiento_tfidf    → TF-IDF con vocabulario (por defecto).
+  entrenamiento_hashing  → --hashing.
+
+Cada medición corre en un proceso aparte (carga en frío y RSS aislados). El resultado queda en
+benchmarks/resultados/<commit>.json (ignorado por git); --comparar muestra la diferencia
+contra otro JSON.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_ml.py
+    python benchmarks/bench_ml.py --estudiantes 5000 --bitacoras 10 --comentarios 3
+    python benchmarks/bench_ml.py --caminos artefacto --entrenamientos hashing
+    python benchmarks/bench_ml.py --comparar benchmarks/resultados/<commit_anterior>.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RUTA_RESULTADOS = os.path.join(RAIZ, 'benchmarks', 'resultados')
+CAMINOS = ['artefacto', 'pkl_disperso', 'pkl_denso']
+ENTRENAMIENTOS = ['tfidf', 'hashing']
+
+FRASES = [
+    'No asiste a clases desde hace dos semanas',
+    'Presenta ansiedad severa antes de las evaluaciones',
+    'Bajo rendimiento en cálculo y física',
+    'Problemas económicos, trabaja de noche',
+    'Se reúne con su tutor, buena disposición',
+    'Reprobó dos asignaturas del semestre',
+    'Situación familiar compleja, cuidado de hermanos',
+    'Asiste regularmente, sin novedades',
+    'Dificultades de adaptación a la universidad',
+    'Derivado a apoyo psicológico',
+]
+
+
+def _configurar_django(ruta_bd):
+    sys.path.insert(0, RAIZ)
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_bd}'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    django.setup()
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def generar_datos(n_estudiantes, bitacoras, comentarios, semilla):
+    """Crea estudiantes con `bitacoras` bitácoras y `comentarios` comentarios por bitácora (bulk_create, sin señales)."""
+    from django.core.management import call_command
+    from sat.models import Bitacora, Carrera, ComentarioBitacora, Estado, Estudiante
+
+    call_command('migrate', verbosity=0)
+    rng = random.Random(semilla)
+
+    carrera = Carrera.objects.create(nombre='Carrera Benchmark')
+    estado = Estado.objects.create(nombre='Activo')
+    Estudiante.objects.bulk_create([
+        Estudiante(
+            rut=f'{i}-B', nombre='Estudiante', apellido=str(i), email=f'bench{i}@ejemplo.cl',
+            carrera=carrera, estado_actual=estado,
+        )
+        for i in range(n_estudiantes)
+    ], batch_size=1000)
+    ids = list(Estudiante.objects.values_list('pk', flat=True))
+
+    Bitacora.objects.bulk_create([
+        Bitacora(
+            estudiante_id=pk,
+            observacion='. '.join(rng.sample(FRASES, 2)),
+            estado_atencion=rng.choice([1, 2, 3]),
+        )
+        for pk in ids for _ in range(bitacoras)
+    ], batch_size=1000)
+    if comentarios:
+        ComentarioBitacora.objects.bulk_create([
+            ComentarioBitacora(bitacora_id=bitacora_id, texto=rng.choice(FRASES))
+            for bitacora_id in Bitacora.objects.values_list('pk', flat=True) for _ in range(comentarios)
+        ], batch_size=1000)
+    return ids
+
+
+def _predecir_original(cerebro, estudiante_obj):
+    """PredictorRiesgo.predecir_estudiante de antes del camino por lotes (con el normalizador actual), como referencia."""
+    import numpy as np
+    import pandas as pd
+    from sat.ml_models.normalizador import normalizar_texto
+
+    bitacoras = estudiante_obj.bitacora_set.prefetch_related('comentarios').all()
+    if not bitacoras.exists():
+        return -1
+
+    cant_rojos = 0
+    cant_amarillos = 0
+    textos = []
+    for b in bitacoras:
+        if b.estado_atencion == 3: cant_rojos += 1
+        elif b.estado_atencion == 2: cant_amarillos += 1
+        if b.observacion: textos.append(b.observacion)
+        for comentario in b.comentarios.all():
+            if comentario.texto: textos.append(comentario.texto)
+
+    X_colores_df = pd.DataFrame(
+        [[min(cant_rojos, 5), min(cant_amarillos, 5)]], columns=['rojos_topados', 'amarillos_topados']
+    )
+    X_colores = cerebro['scaler'].transform(X_colores_df)
+    X_texto = cerebro['tfidf'].transform([normalizar_texto(" ".join(textos))]).toarray()
+    X_final = np.concatenate([X_colores, X_texto * 1.5], axis=1)
+    return cerebro['mapa_orden'][cerebro['model'].predict(X_final)[0]]
+
+
+def medir_camino(camino, repeticiones, semilla):
+    """Corre dentro del proceso hijo: mide un camino y retorna el dict de métricas."""
+    from sat.models import Estudiante, FeatureEstudiante
+    from sat.services import PredictorRiesgo, RUTA_MODELO, TAMANO_BLOQUE
+
+    if camino == 'artefacto':
+        ruta_modelo, disperso = RUTA_MODELO, True
+    else:
+        # .pkl solo (sin el .npz/.json al lado, que tendría prioridad)
+        ruta_modelo = os.path.join(tempfile.mkdtemp(), 'modelo_sat.pkl')
+        shutil.copy(RUTA_MODELO, ruta_modelo)
+        disperso = camino == 'pkl_disperso'
+
+    inicio = time.perf_counter()
+    predictor = PredictorRiesgo(ruta_modelo, disperso=disperso)
+    carga = time.perf_counter() - inicio
+    if not predictor.cerebro:
+        raise RuntimeError(f"El camino {camino} no pudo cargar el modelo.")
+
+    ids = list(Estudiante.objects.order_by('pk').values_list('pk', flat=True))
+    rng = random.Random(semilla)
+
+    # Individual: cada llamada vectoriza desde la BD (el feature store está vacío)
+    FeatureEstudiante.objects.all().delete()
+    predictor.usar_feature_store = False
+    muestra = rng.sample(ids, min(repeticiones, len(ids)))
+    latencias = []
+    for pk in muestra:
+        inicio = time.perf_counter()
+        predictor.predecir_lote_detalle(Estudiante.objects.filter(pk=pk))
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    originales = []
+    if camino == 'pkl_denso':
+        for pk in muestra:
+            estudiante = Estudiante.objects.get(pk=pk)
+            inicio = time.perf_counter()
+            _predecir_original(predictor.cerebro, estudiante)
+            originales.append((time.perf_counter() - inicio) * 1000)
+
+    def lote():
+        inicio = time.perf_counter()
+        for i in range(0, len(ids), TAMANO_BLOQUE):
+            predictor.predecir_lote_detalle(Estudiante.objects.filter(pk__in=ids[i:i + TAMANO_BLOQUE]))
+        return len(ids) / (time.perf_counter() - inicio)
+
+    # Lote en frío (llena el feature store) y luego en caliente
+    predictor.usar_feature_store = True
+    frio = lote()
+    caliente = lote()
+
+    metricas = {
+        'carga_s': round(carga, 4),
+        'individual_p50_ms': round(_percentil(latencias, 50), 3),
+        'individual_p99_ms': round(_percentil(latencias, 99), 3),
+    }
+    if originales:
+        metricas['original_p50_ms'] = round(_percentil(originales, 50), 3)
+        metricas['original_p99_ms'] = round(_percentil(originales, 99), 3)
+    metricas.update({
+        'lote_frio_est_s': round(frio, 1),
+        'lote_caliente_est_s': round(caliente, 1),
+        'rss_max_mb': _rss_max_mb(),
+    })
+    return metricas
+
+
+def medir_entrenamiento(featurizacion):
+    """Corre dentro del proceso hijo: entrenar_modelo sobre la BD, con el artefacto a un temporal."""
+    from django.core.management import call_command
+
+    salida = os.path.join(tempfile.mkdtemp(), 'modelo_bench')
+    inicio = time.perf_counter()
+    call_command('entrenar_modelo', salida=salida, hashing=featurizacion == 'hashing', stdout=io.StringIO())
+    return {
+        'entrenar_s': round(time.perf_counter() - inicio, 3),
+        'rss_max_mb': _rss_max_mb(),
+    }
+
+
+def _rss_max_mb():
+    # ru_maxrss está en KB en Linux (bytes en macOS)
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', '-C', RAIZ, 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'sin-git'
+
+
+def comparar(actual, anterior):
+    print(f"\n📊 {anterior['commit']} → {actual['commit']}")
+    for camino, metricas in actual['resultados'].items():
+        previas = anterior['resultados'].get(camino)
+        if not previas:
+            continue
+        print(f"   {camino}")
+        for nombre, valor in metricas.items():
+            if nombre in previas and previas[nombre]:
+                print(f"      {nombre:<22} {previas[nombre]:>10} → {valor:>10} ({(valor / previas[nombre] - 1):+.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inferencia y entrenamiento del modelo IA.")
+    parser.add_argument('--estudiantes', type=int, default=2000)
+    parser.add_argument('--bitacoras', type=int, default=8, help='Bitácoras por estudiante.')
+    parser.add_argument('--comentarios', type=int, default=2, help='Comentarios por bitácora.')
+    parser.add_argument('--repeticiones', type=int, default=200, help='Llamadas individuales para p50/p99.')
+    parser.add_argument('--caminos', nargs='*', choices=CAMINOS, default=CAMINOS)
+    parser.add_argument(
+        '--entrenamientos', nargs='*', choices=ENTRENAMIENTOS, default=ENTRENAMIENTOS,
+        help='Featurizaciones de entrenar_modelo a medir (sin valores = no mide entrenamiento).',
+    )
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--salida', help='JSON de resultados (por defecto benchmarks/resultados/<commit>.json).')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior para mostrar la diferencia.')
+    # Uso interno: proceso hijo que mide un solo camino (o entrenamiento_<featurizacion>) sobre una BD ya generada
+    parser.add_argument('--_hijo', nargs=2, metavar=('CAMINO', 'BD'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._hijo:
+        camino, ruta_bd = args._hijo
+        _configurar_django(ruta_bd)
+        if camino.startswith('entrenamiento_'):
+            metricas = medir_entrenamiento(camino[len('entrenamiento_'):])
+        else:
+            metricas = medir_camino(camino, args.repeticiones, args.semilla)
+        print(json.dumps(metricas))
+        return
+
+    directorio = tempfile.mkdtemp(prefix='bench_sat_')
+    ruta_bd = os.path.join(directorio, 'bench.sqlite3')
+    try:
+        _configurar_django(ruta_bd)
+        print(f"🧪 Generando {args.estudiantes} estudiantes x {args.bitacoras} bitácoras x {args.comentarios} comentarios...")
+        generar_datos(args.estudiantes, args.bitacoras, args.comentarios, args.semilla)
+
+        resultados = {}
+        for camino in args.caminos + [f'entrenamiento_{f}' for f in args.entrenamientos]:
+            print(f"⏱️  {camino}...")
+            salida = subprocess.run(
+                [sys.executable, '-W', 'ignore', __file__, '--_hijo', camino, ruta_bd,
+                 '--repeticiones', str(args.repeticiones), '--semilla', str(args.semilla)],
+                capture_output=True, text=True, check=True,
+            )
+            # La última línea es el JSON (antes pueden venir los prints de carga del modelo)
+            resultados[camino] = json.loads(salida.stdout.strip().splitlines()[-1])
+            print(f"   {resultados[camino]}")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    informe = {
+        'commit': _commit(),
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'parametros': {
+            'estudiantes': args.estudiantes,
+            'bitacoras': args.bitacoras,
+            'comentarios': args.comentarios,
+            'repeticiones': args.repeticiones,
+            'semilla': args.semilla,
+        },
+        'resultados': resultados,
+    }
+    ruta_salida = args.salida or os.path.join(RUTA_RESULTADOS, f"{informe['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(ruta_salida)), exist_ok=True)
+    with open(ruta_salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, ensure_ascii=False, indent=1)
+    print(f"✅ Resultados en {ruta_salida}")
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            comparar(informe, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
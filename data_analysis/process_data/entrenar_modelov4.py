@@ -1,11 +1,24 @@
+import os
+import re
+import sys
 import pandas as pd
 import numpy as np
 import joblib
-import re
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 from sklearn.feature_extraction.text import TfidfVectorizer
 
+# Exportador del artefacto y normalizador compartido (sat/ml_models/, no requieren Django)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from sat.ml_models.artefacto import exportar_artefacto
+from sat.ml_models.hashing import parametros_hashing, contar_por_bloques, calcular_idf, aplicar_idf
+from sat.ml_models.normalizador import normalizar_lote, STOPWORDS_RIESGO
+
+# 'tfidf' (por defecto): vocabulario ajustado al corpus (max_features=80).
+# 'hashing' (--hashing): sin vocabulario, cada término va a la columna hash(término) % n_features.
+# Se cuenta por bloques en paralelo y solo se aprende el idf; no explica términos en el detalle.
+MODO_FEATURIZACION = 'hashing' if '--hashing' in sys.argv else 'tfidf'
+
 # 1. Cargar Datos
 try:
     df = pd.read_csv("bitacora_final_ready_for_django_v2.csv")
@@ -18,51 +31,45 @@ except FileNotFoundError:
 
 # --- LIMPIEZA AVANZADA ---
 # --- 1.5. Calcular Métricas de Riesgo (Si no vienen en el CSV) ---
-# Contamos cuántas veces aparece [ROJO] y [AMARILLO] en TODAS las columnas
-def contar_etiquetas(row, etiqueta):
-    conteo = 0
-    for col in row.index:
-        val = str(row[col])
-        if etiqueta in val:
-            conteo += val.count(etiqueta)
-    return conteo
+# Contamos cuántas veces aparece [ROJO] y [AMARILLO] en TODAS las columnas.
+# Vectorizado (antes eran df.apply(axis=1) recorriendo cada celda en Python): las celdas
+# de cada fila se unen UNA vez con str.cat y se cuenta con str.count. El separador \x00 no
+# aparece en las etiquetas, así ninguna ocurrencia se arma entre dos celdas.
+# Solo las columnas object pueden contener las etiquetas (números/NaN nunca tienen '[').
+def contar_etiquetas(filas, etiqueta):
+    """Ocurrencias de `etiqueta` en cada fila ya unida (Series de str)."""
+    return filas.str.count(re.escape(etiqueta))
 
 print("🧮 Calculando métricas de riesgo (Rojos/Amarillos)...")
-df['cant_rojos'] = df.apply(lambda x: contar_etiquetas(x, '[ROJO]'), axis=1)
-df['cant_amarillos'] = df.apply(lambda x: contar_etiquetas(x, '[AMARILLO]'), axis=1)
+# astype(str) = str() de cada celda, igual que antes: NaN → 'nan', None → 'None'
+celdas = df.select_dtypes(include='object').astype(str)
+filas = celdas.iloc[:, 0].str.cat(celdas.iloc[:, 1:], sep='\x00') if celdas.shape[1] else pd.Series('', index=df.index)
+df['cant_rojos'] = contar_etiquetas(filas, '[ROJO]')
+df['cant_amarillos'] = contar_etiquetas(filas, '[AMARILLO]')
 
 # --- CONSOLIDACIÓN DE TEXTO (CRÍTICO PARA NLP) ---
 # Juntamos TODAS las columnas de Alerta + Observaciones en un solo texto
 print("📝 Consolidando texto de TODAS las alertas...")
 
-def consolidar_texto_completo(row):
-    """Junta todas las columnas de Alerta + Observaciones en un solo string"""
-    textos = []
-    for col in row.index:
-        if 'Alerta' in col or col == 'Observaciones':
-            val = str(row[col])
-            if val and val != 'nan' and len(val) > 2:
-                textos.append(val)
-    return " || ".join(textos)
-
-df['texto_completo'] = df.apply(consolidar_texto_completo, axis=1)
+def consolidar_texto_completo(df):
+    """Junta todas las columnas de Alerta + Observaciones de cada fila en un solo string"""
+    columnas = [col for col in df.columns if 'Alerta' in col or col == 'Observaciones']
+    texto = pd.Series('', index=df.index, dtype=object)
+    # Columna por columna (en su orden) sobre todas las filas a la vez, en vez de fila por fila
+    for col in columnas:
+        val = df[col].astype(str)
+        valido = (val != 'nan') & (val.str.len() > 2)
+        # Un texto válido nunca es vacío: texto == '' ⇔ todavía no hay nada que separar
+        con_separador = texto.where(texto == '', texto + " || ")
+        texto = texto.where(~valido, con_separador + val)
+    return texto
+
+df['texto_completo'] = consolidar_texto_completo(df)
 
 # --- LIMPIEZA AVANZADA ---
-def limpiar_obs_avanzado(texto):
-    if not isinstance(texto, str): return ""
-    txt = str(texto).lower()
-    
-    # PRIMERO: Quitar las etiquetas de color [ROJO] [AMARILLO] 
-    txt = txt.replace('[rojo]', '').replace('[amarillo]', '')
-    
-    # Quitar acentos básicos para estandarizar
-    txt = txt.replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u')
-    # Quitar números y signos
-    txt = re.sub(r'\d+', '', txt)
-    txt = re.sub(r'[^\w\s]', '', txt)
-    return txt
-
-df['obs_limpia'] = df['texto_completo'].fillna('').apply(limpiar_obs_avanzado)
+# Normalizador compartido con la inferencia (sat/ml_models/normalizador.py):
+# quita [ROJO]/[AMARILLO], acentos (incluye ñ/ü), números y signos.
+df['obs_limpia'] = normalizar_lote(df['texto_completo'].fillna(''))
 
 # Topamos valores extremos para que el gráfico no se rompa
 df['rojos_topados'] = df['cant_rojos'].clip(upper=5)
@@ -81,34 +88,26 @@ X_colores = df[['riesgo_score', 'rojos_topados', 'amarillos_topados']]
 X_colores_scaled = scaler.fit_transform(X_colores)
 
 # B. Datos de Texto (NLP Mejorado)
-# LISTA NEGRA: Palabras que NO nos importan para detectar riesgo
-mis_stopwords = [
-    # Conectores
-    'el', 'la', 'de', 'en', 'y', 'a', 'que', 'los', 'se', 'un', 'del', 'con', 'no', 'si', 'por', 'lo', 'su', 'para', 'al', 'es', 'son', 'como', 'pero', 'mas', 'esta', 'este', 'fue', 'ha', 'le',
-    # Contexto irrelevante
-    'estudiante', 'alumno', 'alumna', 'tutorado', 'tutor', 'tutoria', 'carrera', 'universidad', 'año', 'semestre',
-    # Datos Socioeconómicos/Perfil (que se repiten mucho y ensucian)
-    'gratuidad', 'beca', 'fondo', 'solidario', 'cae', 'residencia', 'procedencia', 'beneficio', 'arancel',
-    # Familia (Información de contexto, no alerta)
-    'mama', 'papa', 'madre', 'padre', 'hermano', 'hermana', 'abuela', 'abuelo', 'tio', 'tia', 'vive', 'familia', 'hogar',
-    # Rellenos comunes
-    'bien', 'mal', 'regular', 'contacto', 'correo', 'telefono', 'whatsapp', 'celular', 'responde', 'contesta',
-    # Administrativo (Fechas, trámites, etc.)
-    'llega', 'espera', 'fecha', 'interinstitucional', 'traslado', 'dice', 'va', 'tiene', 'esta',
-    # Palabras genéricas encontradas
-    'primera', 'ninguna', 'opcion', 'taller', 'casa', 'poco', 'depues', 'fundamentos'
-]
+# LISTA NEGRA: palabras que NO nos importan para detectar riesgo (compartida con manage.py entrenar_modelo)
+mis_stopwords = STOPWORDS_RIESGO
 
 print("🧠 Analizando texto (buscando PATOLOGÍAS, no rellenos)...")
 # ngram_range=(1,2) permite capturar frases de 2 palabras como "ansiedad severa" o "bajo rendimiento"
 # min_df=3 significa que una palabra debe aparecer en al menos 3 documentos para ser considerada
-tfidf = TfidfVectorizer(
-    max_features=80,  # Reducido para darle menos peso al texto
-    stop_words=mis_stopwords,
-    ngram_range=(1, 2),
-    min_df=3  # Filtrar palabras muy raras
-)
-X_texto = tfidf.fit_transform(df['obs_limpia']).toarray()
+if MODO_FEATURIZACION == 'hashing':
+    config_hashing = parametros_hashing(stop_words=mis_stopwords)
+    X_conteos = contar_por_bloques(df['obs_limpia'], config_hashing, n_jobs=-1)
+    idf_hashing = calcular_idf(X_conteos)
+    X_texto = aplicar_idf(X_conteos, idf_hashing).toarray()
+    print(f"   #️⃣ Hashing: {config_hashing['n_features']} columnas (sin vocabulario)")
+else:
+    tfidf = TfidfVectorizer(
+        max_features=80,  # Reducido para darle menos peso al texto
+        stop_words=mis_stopwords,
+        ngram_range=(1, 2),
+        min_df=3  # Filtrar palabras muy raras
+    )
+    X_texto = tfidf.fit_transform(df['obs_limpia']).toarray()
 
 # C. Unir Matrices
 # REDUCIMOS peso del texto porque el contenido es muy similar entre todos
@@ -156,11 +155,25 @@ for nivel in range(4):
         print(f"   🗣️ Se habla de: {temas}")
 
 # 5. Guardar
-joblib.dump({
+cerebro = {
     'model': kmeans, 
     'scaler': scaler, 
-    'tfidf': tfidf,
     'mapa_orden': mapa_orden,
     'nombres_clusters': nombres_sugeridos
-}, 'modelo_sat.pkl')
-print("\n✅ Modelo actualizado y guardado.")
\ No newline at end of file
+}
+if MODO_FEATURIZACION == 'hashing':
+    # Solo se puede servir desde el artefacto compacto (PredictorRiesgo no carga este .pkl)
+    cerebro.update({'featurizacion': 'hashing', 'hashing': config_hashing, 'idf': idf_hashing})
+else:
+    cerebro['tfidf'] = tfidf
+joblib.dump(cerebro, 'modelo_sat.pkl')
+print("\n✅ Modelo actualizado y guardado.")
+
+# 6. Exportar artefacto compacto (modelo_sat.npz + modelo_sat.json) para los workers
+# Los pesos deben ser los mismos usados al concatenar X_final más arriba
+# orden_riesgo: mismos coeficientes del riesgo_score con que se ordenaron los clusters (paso 4)
+version = exportar_artefacto(
+    cerebro, 'modelo_sat', peso_colores=2.5, peso_texto=0.5,
+    orden_riesgo={'rojos_topados': 3, 'amarillos_topados': 1},
+)
+print(f"📦 Artefacto compacto exportado (versión {version}). Copiar los 3 archivos a sat/ml_models/.")
\ No newline at end of file
@@ -1,11 +1,17 @@
+import os
+import sys
 import pandas as pd
 import numpy as np
 import joblib
-import re
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 from sklearn.feature_extraction.text import TfidfVectorizer
 
+# Exportador del artefacto y normalizador compartido (sat/ml_models/, no requieren Django)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from sat.ml_models.artefacto import exportar_artefacto
+from sat.ml_models.normalizador import normalizar_lote
+
 # 1. Cargar Datos
 try:
     df = pd.read_csv("dataset_sat_unificado.csv")
@@ -17,17 +23,8 @@ except FileNotFoundError:
     exit()
 
 # --- LIMPIEZA AVANZADA ---
-def limpiar_obs_avanzado(texto):
-    if not isinstance(texto, str): return ""
-    txt = str(texto).lower()
-    # Quitar acentos básicos para estandarizar
-    txt = txt.replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u')
-    # Quitar números y signos
-    txt = re.sub(r'\d+', '', txt)
-    txt = re.sub(r'[^\w\s]', '', txt)
-    return txt
-
-df['obs_limpia'] = df['observaciones'].fillna('').apply(limpiar_obs_avanzado)
+# Normalizador compartido con la inferencia (sat/ml_models/normalizador.py)
+df['obs_limpia'] = normalizar_lote(df['observaciones'].fillna(''))
 
 # Topamos valores extremos para que el gráfico no se rompa
 df['rojos_topados'] = df['cant_rojos'].clip(upper=5)
@@ -54,6 +51,8 @@ mis_stopwords = [
     # Rellenos comunes
     'bien', 'mal', 'regular', 'contacto', 'correo', 'telefono', 'whatsapp', 'celular', 'responde', 'contesta'
 ]
+# Mismo normalizador que los textos, si no 'año' nunca coincidiría con el token 'ano'
+mis_stopwords = sorted(set(normalizar_lote(mis_stopwords)))
 
 print("🧠 Analizando texto (buscando PATOLOGÍAS, no rellenos)...")
 # ngram_range=(1,2) permite capturar frases de 2 palabras como "ansiedad severa" o "bajo rendimiento"
@@ -111,11 +110,21 @@ for nivel in range(5):
         print(f"   🗣️ Se habla de: {temas}")
 
 # 5. Guardar
-joblib.dump({
+cerebro = {
     'model': kmeans, 
     'scaler': scaler, 
     'tfidf': tfidf,
     'mapa_orden': mapa_orden,
     'nombres_clusters': nombres_sugeridos
-}, 'modelo_sat.pkl')
-print("\n✅ Modelo actualizado y guardado.")
\ No newline at end of file
+}
+joblib.dump(cerebro, 'modelo_sat.pkl')
+print("\n✅ Modelo actualizado y guardado.")
+
+# 6. Exportar artefacto compacto (modelo_sat.npz + modelo_sat.json) para los workers
+# Los pesos deben ser los mismos usados al concatenar X_final más arriba
+# orden_riesgo: mismos coeficientes del riesgo_score con que se ordenaron los clusters (paso 4)
+version = exportar_artefacto(
+    cerebro, 'modelo_sat', peso_colores=1.0, peso_texto=1.5,
+    orden_riesgo={'rojos_topados': 2, 'amarillos_topados': 1},
+)
+print(f"📦 Artefacto compacto exportado (versión {version}). Copiar los 3 archivos a sat/ml_models/.")
\ No newline at end of file
@@ -1,11 +1,43 @@
 # -*- encoding: utf-8 -*-
 """
 Copyright (c) 2019 - present AppSeed.us
+
+Se carga en todos los arranques (Dockerfile, docker-compose.yml y Procfile) con
+`gunicorn -c gunicorn-cfg.py --bind ...`; el --bind de cada uno pisa el de acá.
 """
 
 bind = '0.0.0.0:5005'
 workers = 1
+# Varios hilos por worker (gthread): los recálculos individuales concurrentes se agrupan
+# en una sola predicción (sat/services.py, CoalescedorPredicciones)
+threads = 4
 accesslog = '-'
 loglevel = 'debug'
 capture_output = True
 enable_stdio_inheritance = True
+
+# Django y el modelo IA se cargan UNA vez en el maestro, antes del fork: los workers los
+# heredan copy-on-write y los arreglos del artefacto quedan mapeados en memoria
+# (sat/ml_models/cache/mmap/), así agregar workers casi no suma memoria por el modelo.
+# Nota: con preload_app, un cambio de código requiere reiniciar el maestro (no basta HUP).
+# El modelo reentrenado sí se recarga solo en cada worker (obtener_predictor).
+preload_app = True
+
+
+def when_ready(server):
+    """Maestro listo (app ya importada por preload_app) y aún sin workers."""
+    import gc
+
+    from django.db import connections
+    from django.urls import get_resolver
+    from sat.services import precargar_modelo
+
+    # Calentar Django: URLconf (importa todas las vistas) y el modelo IA
+    get_resolver().url_patterns
+    predictor = precargar_modelo()
+    server.log.info(f"Modelo IA precargado (versión {predictor.version_modelo}).")
+
+    # Ninguna conexión a la BD debe cruzar el fork (cada worker abre las suyas)
+    connections.close_all()
+    # Lo cargado hasta acá queda fuera del GC: sus recorridos no tocan (ni copian) esas páginas
+    gc.freeze()
@@ -6,7 +6,8 @@ from .models import (
     Usuario, Rol, Carrera, Estudiante,
     Estado, TipoDesercion, HistorialEstado,
     Tutoria, TipoTutoria, ClasificacionTutoria, Asistencia,
-    Bitacora, ComentarioBitacora, Alarma, TipoAlarma, Notificacion, HistorialRiesgo
+    Bitacora, ComentarioBitacora, Alarma, TipoAlarma, Notificacion, HistorialRiesgo,
+    FeatureEstudiante, MarcaRecalculo, TrabajoRecalculo, EjecucionBatch
 )
 
 # Registro básico de modelos
@@ -29,4 +30,8 @@ admin.site.register(Bitacora)
 admin.site.register(ComentarioBitacora)
 admin.site.register(Alarma)
 admin.site.register(Notificacion)
-admin.site.register(HistorialRiesgo)
\ No newline at end of file
+admin.site.register(HistorialRiesgo)
+admin.site.register(FeatureEstudiante)
+admin.site.register(MarcaRecalculo)
+admin.site.register(TrabajoRecalculo)
+admin.site.register(EjecucionBatch)
\ No newline at end of file
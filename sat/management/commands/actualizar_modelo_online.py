@@ -0,0 +1,201 @@
+"""
+Management Command: actualizar_modelo_online
+============================================
+Aprendizaje online del modelo de riesgo: mueve los centroides del artefacto compacto
+con MiniBatchKMeans.partial_fit usando a los estudiantes con bitácoras o comentarios
+nuevos o editados desde la última actualización, sin reentrenar desde el CSV. "Nuevo" se
+mide con la hora del servidor (fecha_modificacion), no con la fecha_registro que ingresa
+el usuario (suele ser medianoche o una fecha pasada en cargas CSV).
+
+  1. El vocabulario TF-IDF, el idf y el scaler quedan congelados: solo cambian los
+     centroides. El feature store está sellado con la versión de la featurización (no con
+     la del modelo), así que al publicar sus filas siguen vigentes y el batch no re-vectoriza.
+  2. Los centroides parten de los del artefacto con su "masa" acumulada (arreglo
+     'conteos'); en la primera corrida cada centroide parte con --masa-inicial.
+  3. reassignment_ratio=0: ningún cluster se reasigna al azar, así cada id de cluster
+     conserva su significado entre corridas.
+  4. Al final se recalcula mapa_orden ordenando los centroides por su riesgo_score
+     (coeficientes 'orden_riesgo' del artefacto, por defecto rojos x2 + amarillos).
+  5. Cada corrida deja un checkpoint versionado en sat/ml_models/checkpoints/;
+     con --publicar además reemplaza el artefacto en uso (los workers lo recargan solos).
+
+Uso:
+    python manage.py actualizar_modelo_online              # solo checkpoint
+    python manage.py actualizar_modelo_online --publicar   # checkpoint + artefacto en uso
+    python manage.py actualizar_modelo_online --dry-run    # solo muestra cuánto se moverían
+"""
+
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from sklearn.cluster import MiniBatchKMeans
+
+from sat.ml_models.artefacto import leer_artefacto, guardar_artefacto
+from sat.models import Bitacora, ComentarioBitacora
+from sat.services import PredictorRiesgo, RUTA_MODELO, RUTA_ARTEFACTO
+
+RUTA_CHECKPOINTS = os.path.join(os.path.dirname(RUTA_MODELO), 'checkpoints')
+
+# Coeficientes del riesgo_score para artefactos exportados antes de guardar 'orden_riesgo'
+# (entrenar_modelov3.py: cant_rojos * 2 + cant_amarillos)
+ORDEN_RIESGO_POR_DEFECTO = {'rojos_topados': 2.0, 'amarillos_topados': 1.0}
+
+
+def calcular_mapa_orden(centroides, arreglos, meta):
+    """
+    Nivel de cada centroide según su riesgo_score, en las unidades originales
+    (se deshacen los pesos y el StandardScaler de la parte numérica).
+    """
+    columnas = meta['columnas_numericas']
+    n_num = len(columnas)
+    numericas = centroides[:, :n_num] / arreglos['pesos'][:n_num] * arreglos['scaler_escala'] + arreglos['scaler_media']
+
+    orden_riesgo = meta.get('orden_riesgo') or ORDEN_RIESGO_POR_DEFECTO
+    score = sum(peso * numericas[:, columnas.index(col)] for col, peso in orden_riesgo.items())
+    # 'stable' → ante empates se respeta el id del cluster
+    return {int(cluster_id): nivel for nivel, cluster_id in enumerate(np.argsort(score, kind='stable'))}
+
+
+class Command(BaseCommand):
+    help = (
+        "Actualiza los centroides del modelo IA con MiniBatchKMeans.partial_fit "
+        "usando a los estudiantes con bitácoras o comentarios nuevos (aprendizaje online)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=256,
+            help='Estudiantes por paso de partial_fit (por defecto 256).',
+        )
+        parser.add_argument(
+            '--masa-inicial',
+            type=float,
+            default=100.0,
+            help='Peso de cada centroide entrenado si el artefacto aún no tiene conteos (por defecto 100).',
+        )
+        parser.add_argument(
+            '--publicar',
+            action='store_true',
+            help='Además del checkpoint, reemplaza el artefacto en uso (sat/ml_models/modelo_sat.npz/.json).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Calcula la actualización y muestra el resumen sin escribir archivos.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        dry_run = options['dry_run']
+        hasta = timezone.now()
+
+        try:
+            arreglos, meta = leer_artefacto(RUTA_ARTEFACTO)
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f"❌ No se pudo leer el artefacto compacto: {e}"))
+            return
+
+        predictor = PredictorRiesgo(guardar_features=not options['dry_run'])
+        if predictor.motor is None or predictor.version_modelo != meta['version_modelo']:
+            self.stderr.write(self.style.ERROR("❌ El predictor no cargó el artefacto compacto en uso."))
+            return
+
+        # ── Estudiantes con actividad nueva desde la última actualización ──
+        online = meta.get('online') or {}
+        bitacoras = Bitacora.objects.filter(fecha_modificacion__lte=hasta)
+        comentarios = ComentarioBitacora.objects.filter(fecha_modificacion__lte=hasta)
+        desde = parse_datetime(online['hasta']) if online.get('hasta') else None
+        if desde:
+            bitacoras = bitacoras.filter(fecha_modificacion__gt=desde)
+            comentarios = comentarios.filter(fecha_modificacion__gt=desde)
+        ids = sorted(
+            set(bitacoras.values_list('estudiante_id', flat=True))
+            | set(comentarios.values_list('bitacora__estudiante_id', flat=True))
+        )
+
+        self.stdout.write(
+            f"🧠 Modelo {meta['version_modelo']} | estudiantes con actividad nueva "
+            f"{'desde ' + f'{desde:%Y-%m-%d %H:%M}' if desde else '(primera actualización)'}: {len(ids)}"
+        )
+        if not ids:
+            self.stdout.write(self.style.WARNING("⚠️  No hay datos nuevos. El modelo no cambia."))
+            return
+
+        # ── MiniBatchKMeans sembrado con los centroides y su masa acumulada ──
+        centroides = arreglos['centroides']
+        k = centroides.shape[0]
+        conteos = arreglos['conteos'] if 'conteos' in arreglos else np.full(k, options['masa_inicial'])
+
+        mbk = MiniBatchKMeans(
+            n_clusters=k,
+            init=centroides,
+            n_init=1,
+            batch_size=batch_size,
+            reassignment_ratio=0.0,
+            compute_labels=False,
+            random_state=42,
+        )
+        # Primer paso con los propios centroides ponderados por su masa: quedan donde estaban
+        # y partial_fit arranca con esos conteos (cuánto pesan frente a los datos nuevos)
+        mbk.partial_fit(centroides, sample_weight=conteos)
+        conteos = conteos.astype(np.float64).copy()
+
+        pasos = 0
+        usados = 0
+        for inicio in range(0, len(ids), batch_size):
+            ids_bloque, X = predictor.matriz_ponderada(ids[inicio:inicio + batch_size])
+            if not ids_bloque:
+                continue
+            # Misma asignación que hace partial_fit antes de mover los centroides
+            conteos += np.bincount(mbk.predict(X), minlength=k)
+            mbk.partial_fit(X)
+            pasos += 1
+            usados += len(ids_bloque)
+
+        nuevos = mbk.cluster_centers_
+        desplazamiento = np.sqrt(((nuevos - centroides) ** 2).sum(axis=1))
+        mapa_anterior = {int(c): n for c, n in meta['mapa_orden'].items()}
+        mapa_orden = calcular_mapa_orden(nuevos, arreglos, meta)
+
+        self.stdout.write(f"   Pasos de partial_fit : {pasos} ({usados} estudiantes)")
+        for cluster_id in sorted(mapa_orden, key=mapa_orden.get):
+            self.stdout.write(
+                f"   Cluster {cluster_id} → nivel {mapa_orden[cluster_id]} | "
+                f"masa {conteos[cluster_id]:.0f} | desplazamiento {desplazamiento[cluster_id]:.4f}"
+            )
+        if mapa_orden != mapa_anterior:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  El orden de riesgo de los clusters cambió: {mapa_anterior} → {mapa_orden}"
+            ))
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING("⚠️  DRY-RUN: no se escribió ningún archivo."))
+            return
+
+        arreglos = dict(arreglos, centroides=nuevos, conteos=conteos)
+        meta = dict(meta, mapa_orden={str(c): n for c, n in mapa_orden.items()}, online={
+            'hasta': hasta.isoformat(),
+            'estudiantes': usados,
+            'pasos': pasos,
+            'version_anterior': meta['version_modelo'],
+        })
+
+        os.makedirs(RUTA_CHECKPOINTS, exist_ok=True)
+        ruta_checkpoint = os.path.join(RUTA_CHECKPOINTS, f"modelo_sat_{hasta:%Y%m%d_%H%M%S}")
+        version = guardar_artefacto(arreglos, meta, ruta_checkpoint)
+        self.stdout.write(self.style.SUCCESS(f"📦 Checkpoint {version} guardado en {ruta_checkpoint}.npz/.json"))
+
+        if options['publicar']:
+            guardar_artefacto(arreglos, meta, RUTA_ARTEFACTO)
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Artefacto en uso actualizado a {version}. Ejecuta recalcular_riesgos_batch --full para aplicarlo."
+            ))
+            self.stdout.write(
+                f"   Featurización {predictor.version_featurizacion} sin cambios: el batch reutiliza el "
+                f"feature store y no vuelve a vectorizar."
+            )
@@ -5,7 +5,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.db.models.signals import post_save
 from sat.models import Usuario, Estudiante, Bitacora, Carrera, Rol, Estado, Notificacion
-from sat.services import PredictorRiesgo
+from sat.services import PredictorRiesgo, CAMPOS_DETALLE_IA, guardar_detalle_ia
 # IMPORTANTE: Importamos tu señal para poder apagarla
 from sat.signals import notificar_observacion
 
@@ -65,6 +65,7 @@ class Command(BaseCommand):
                 reader = csv.DictReader(file)
                 count = 0
                 bitacoras_creadas = 0
+                ids_cargados = set()
                 
                 for row in reader:
                     try:
@@ -137,10 +138,8 @@ class Command(BaseCommand):
                                 )
                                 if created: bitacoras_creadas += 1
 
-                        # --- IA ---
-                        nuevo_riesgo = predictor.predecir_estudiante(estudiante_obj)
-                        estudiante_obj.nivel_riesgo_ia = nuevo_riesgo
-                        estudiante_obj.save()
+                        # La IA se calcula al final, en lote (ver abajo)
+                        ids_cargados.add(estudiante_obj.pk)
 
                         count += 1
                         if count % 100 == 0:
@@ -149,6 +148,22 @@ class Command(BaseCommand):
                     except Exception as e:
                         self.stdout.write(self.style.ERROR(f"❌ Error en estudiante {row.get('rut', 'Desconocido')}: {e}"))
 
+            # --- IA (una predicción vectorizada por bloque en vez de una por fila) ---
+            self.stdout.write("🧠 Calculando riesgo IA de los estudiantes cargados...")
+            sin_cambio = []
+            for estudiante_obj, nuevo_riesgo in predictor.iterar_predicciones(
+                Estudiante.objects.filter(pk__in=ids_cargados)
+            ):
+                if nuevo_riesgo is None:
+                    self.stdout.write(self.style.ERROR(f"❌ No se pudo predecir el riesgo de {estudiante_obj.rut}"))
+                    continue
+                if nuevo_riesgo != estudiante_obj.nivel_riesgo_ia:
+                    estudiante_obj.nivel_riesgo_ia = nuevo_riesgo
+                    estudiante_obj.save(update_fields=['nivel_riesgo_ia'] + CAMPOS_DETALLE_IA)
+                else:
+                    sin_cambio.append(estudiante_obj)
+            guardar_detalle_ia(sin_cambio)
+
             self.stdout.write(self.style.SUCCESS(f"✅ FINALIZADO: {count} estudiantes inyectados. {bitacoras_creadas} bitácoras creadas."))
 
         finally:
@@ -0,0 +1,147 @@
+"""
+Management Command: entrenar_modelo
+===================================
+Entrena el modelo de riesgo directamente desde la BD (Bitacora + ComentarioBitacora),
+incluyendo todo lo registrado en la app, en vez del CSV congelado de data_analysis/.
+
+Mismo modelo que entrenar_modelov4.py (riesgo_score + colores x2.5, TF-IDF x0.5, KMeans; ver
+sat/ml_models/entrenamiento.py), pero con las features tal como las calcula la inferencia
+(sat/services.py):
+
+  1. Rojos/amarillos por estudiante: una sola consulta agregada (COUNT ... FILTER).
+  2. Textos: una consulta leída con cursor del lado del servidor, por bloques de
+     --chunk-size filas; cada estudiante se normaliza y se vectoriza al vuelo, así en
+     memoria solo queda la matriz dispersa de conteos, nunca el texto completo.
+  3. KMeans sobre la matriz dispersa [colores | texto] (no se densifica).
+  4. El artefacto se escribe con temporal + rename (guardar_artefacto): los workers que
+     lo recargan nunca leen un archivo a medio escribir.
+
+Uso:
+    python manage.py entrenar_modelo                  # reemplaza sat/ml_models/modelo_sat.npz/.json
+    python manage.py entrenar_modelo --hashing        # featurización por hashing (sin vocabulario)
+    python manage.py entrenar_modelo --salida /tmp/candidato   # no toca el artefacto en uso
+"""
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from scipy import sparse
+
+from sat.ml_models.artefacto import exportar_artefacto
+from sat.ml_models.entrenamiento import (
+    PESO_COLORES, PESO_TEXTO, ORDEN_RIESGO,
+    matriz_colores, vectorizar_tfidf, matriz_final, ajustar_kmeans, mapa_orden_por_score,
+)
+from sat.ml_models.hashing import parametros_hashing, contar_por_bloques, calcular_idf, aplicar_idf
+from sat.ml_models.normalizador import normalizar_texto, STOPWORDS_RIESGO
+from sat.models import Bitacora
+from sat.services import RUTA_ARTEFACTO, conteos_bitacoras, iterar_textos_estudiantes
+
+
+class Command(BaseCommand):
+    help = (
+        "Entrena el modelo IA desde las bitácoras y comentarios de la BD y publica "
+        "el artefacto compacto de forma atómica."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clusters',
+            type=int,
+            default=4,
+            help='Cantidad de clusters / niveles de riesgo (por defecto 4).',
+        )
+        parser.add_argument(
+            '--hashing',
+            action='store_true',
+            help='Featurización por hashing en vez de TF-IDF con vocabulario (ver sat/ml_models/hashing.py).',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Filas por lectura del cursor y documentos por bloque de vectorización (por defecto 2000).',
+        )
+        parser.add_argument(
+            '--salida',
+            default=RUTA_ARTEFACTO,
+            help='Ruta base del artefacto (por defecto el artefacto en uso, sat/ml_models/modelo_sat).',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        chunk_size = max(1, options['chunk_size'])
+        bitacoras_qs = Bitacora.objects.all()
+
+        # ── 1. Colores: una consulta agregada ──
+        conteos = conteos_bitacoras(bitacoras_qs)
+        if len(conteos) < options['clusters']:
+            self.stderr.write(self.style.ERROR(
+                f"❌ Solo {len(conteos)} estudiantes con bitácoras: no alcanzan para {options['clusters']} clusters."
+            ))
+            return
+        self.stdout.write(f"📊 {len(conteos)} estudiantes con bitácoras.")
+
+        # ── 2. Texto: streaming por estudiante ──
+        ids = []
+
+        def documentos():
+            for estudiante_id, textos in iterar_textos_estudiantes(bitacoras_qs, chunk_size=chunk_size):
+                ids.append(estudiante_id)
+                yield normalizar_texto(" ".join(textos))
+
+        self.stdout.write("🧠 Vectorizando texto desde la BD...")
+        if options['hashing']:
+            config_hashing = parametros_hashing(stop_words=STOPWORDS_RIESGO)
+            partes, bloque = [], []
+            for documento in documentos():
+                bloque.append(documento)
+                if len(bloque) == chunk_size:
+                    partes.append(contar_por_bloques(bloque, config_hashing, tamano_bloque=chunk_size))
+                    bloque = []
+            if bloque:
+                partes.append(contar_por_bloques(bloque, config_hashing, tamano_bloque=chunk_size))
+            X_conteos = sparse.vstack(partes).tocsr()
+            idf_hashing = calcular_idf(X_conteos)
+            X_texto = aplicar_idf(X_conteos, idf_hashing)
+        else:
+            # fit_transform consume el generador: solo se acumulan los conteos dispersos
+            tfidf, X_texto = vectorizar_tfidf(documentos())
+
+        # Mismo orden de filas que el texto
+        rojos = [conteos[pk][1] for pk in ids]
+        amarillos = [conteos[pk][2] for pk in ids]
+        X_colores, scaler, X_colores_scaled = matriz_colores(rojos, amarillos)
+
+        # ── 3. KMeans sobre la matriz dispersa ──
+        X_final = matriz_final(X_colores_scaled, X_texto)
+        self.stdout.write(
+            f"🤖 Entrenando KMeans ({options['clusters']} clusters) sobre {X_final.shape[0]}x{X_final.shape[1]} "
+            f"({X_final.nnz} valores no nulos)..."
+        )
+        kmeans = ajustar_kmeans(X_final, options['clusters'])
+        mapa_orden = mapa_orden_por_score(X_colores['riesgo_score'], kmeans.labels_)
+
+        for cluster_id in sorted(mapa_orden, key=mapa_orden.get):
+            miembros = kmeans.labels_ == cluster_id
+            self.stdout.write(
+                f"   Nivel {mapa_orden[cluster_id]} (cluster {cluster_id}) | {miembros.sum()} estudiantes | "
+                f"🔴 {np.mean(np.asarray(rojos)[miembros]):.1f} | 🟡 {np.mean(np.asarray(amarillos)[miembros]):.1f}"
+            )
+
+        # ── 4. Artefacto (escritura atómica) ──
+        cerebro = {'model': kmeans, 'scaler': scaler, 'mapa_orden': mapa_orden}
+        if options['hashing']:
+            cerebro.update({'featurizacion': 'hashing', 'hashing': config_hashing, 'idf': idf_hashing})
+        else:
+            cerebro['tfidf'] = tfidf
+        version = exportar_artefacto(
+            cerebro, options['salida'], peso_colores=PESO_COLORES, peso_texto=PESO_TEXTO, orden_riesgo=ORDEN_RIESGO,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"📦 Artefacto {version} guardado en {options['salida']}.npz/.json "
+            f"({time.perf_counter() - inicio:.1f}s)."
+        ))
+        if options['salida'] == RUTA_ARTEFACTO:
+            self.stdout.write("   Ejecuta recalcular_riesgos_batch --full para aplicarlo.")
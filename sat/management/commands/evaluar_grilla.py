@@ -0,0 +1,196 @@
+"""
+Management Command: evaluar_grilla
+==================================
+Selección de modelo sin editar los entrenar_modelov*.py: evalúa una grilla de
+max_features (TF-IDF) × peso del texto × cantidad de clusters sobre los datos de la BD.
+
+  1. Las features se leen una sola vez (mismas consultas que entrenar_modelo).
+  2. La matriz TF-IDF se calcula una vez por max_features y queda en caché en disco
+     (joblib.Memory en sat/ml_models/cache/, ignorada por git): repetir la grilla no
+     re-vectoriza si los textos no cambiaron. Al terminar la caché se recorta a --cache-mb,
+     borrando primero las matrices usadas hace más tiempo.
+  3. Cada configuración se entrena y se mide en un proceso aparte (joblib, --workers):
+     silueta, tamaño de cada nivel y acuerdo con las etiquetas manuales (nivel_riesgo_manual).
+  4. Con --exportar la mejor configuración (--criterio) se publica como artefacto.
+
+Uso:
+    python manage.py evaluar_grilla
+    python manage.py evaluar_grilla --max-features 40 80 --pesos-texto 0.5 1.5 --clusters 4 5
+    python manage.py evaluar_grilla --criterio hitl --exportar --salida /tmp/candidato
+"""
+
+import os
+import time
+from itertools import product
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from joblib import Memory, Parallel, delayed
+
+from sat.ml_models.artefacto import exportar_artefacto
+from sat.ml_models.entrenamiento import (
+    PESO_COLORES, ORDEN_RIESGO, matriz_colores, vectorizar_tfidf, evaluar_config,
+)
+from sat.ml_models.normalizador import normalizar_texto
+from sat.models import Bitacora, Estudiante
+from sat.services import RUTA_MODELO, RUTA_ARTEFACTO, conteos_bitacoras, iterar_textos_estudiantes
+
+RUTA_CACHE = os.path.join(os.path.dirname(RUTA_MODELO), 'cache')
+# Tope por defecto de la caché de TF-IDF; cada cambio en los textos agrega matrices nuevas
+CACHE_MB = 200
+
+
+def _clave_orden(resultado, criterio):
+    """Mayor es mejor. Sin silueta/etiquetas la configuración queda al final."""
+    silueta = resultado['silueta'] if resultado['silueta'] is not None else -1.0
+    acuerdo = resultado['acuerdo_hitl'] if resultado['acuerdo_hitl'] is not None else -1.0
+    return (acuerdo, silueta) if criterio == 'hitl' else (silueta, acuerdo)
+
+
+class Command(BaseCommand):
+    help = (
+        "Evalúa en paralelo una grilla de configuraciones del modelo IA (max_features, peso "
+        "del texto, clusters) y opcionalmente exporta la mejor como artefacto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-features',
+            type=int,
+            nargs='+',
+            default=[40, 80, 160],
+            help='Valores de max_features del TF-IDF (por defecto 40 80 160).',
+        )
+        parser.add_argument(
+            '--pesos-texto',
+            type=float,
+            nargs='+',
+            default=[0.5, 1.5, 2.5],
+            help='Multiplicadores del bloque de texto (por defecto 0.5 1.5 2.5).',
+        )
+        parser.add_argument(
+            '--clusters',
+            type=int,
+            nargs='+',
+            default=[3, 4, 5],
+            help='Cantidades de clusters (por defecto 3 4 5).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=-1,
+            help='Procesos para evaluar la grilla (-1 = todos los núcleos, por defecto).',
+        )
+        parser.add_argument(
+            '--criterio',
+            choices=['silueta', 'hitl'],
+            default='silueta',
+            help='Cómo elegir la mejor: silueta o acuerdo con las etiquetas manuales (por defecto silueta).',
+        )
+        parser.add_argument(
+            '--exportar',
+            action='store_true',
+            help='Exporta la mejor configuración como artefacto (ver --salida).',
+        )
+        parser.add_argument(
+            '--salida',
+            default=RUTA_ARTEFACTO,
+            help='Ruta base del artefacto exportado (por defecto el artefacto en uso, sat/ml_models/modelo_sat).',
+        )
+        parser.add_argument(
+            '--sin-cache',
+            action='store_true',
+            help='No usa ni guarda la caché de matrices TF-IDF.',
+        )
+        parser.add_argument(
+            '--cache-mb',
+            type=int,
+            default=CACHE_MB,
+            help=f'Tamaño máximo de la caché de TF-IDF en MB; se borran las entradas menos usadas (por defecto {CACHE_MB}).',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['clusters']) < 2:
+            raise CommandError("Cada cantidad de clusters debe ser al menos 2.")
+        inicio = time.perf_counter()
+
+        # ── Features una sola vez ──
+        bitacoras_qs = Bitacora.objects.all()
+        conteos = conteos_bitacoras(bitacoras_qs)
+        ids, documentos = [], []
+        for estudiante_id, textos in iterar_textos_estudiantes(bitacoras_qs):
+            ids.append(estudiante_id)
+            documentos.append(normalizar_texto(" ".join(textos)))
+        if len(ids) <= max(options['clusters']):
+            raise CommandError(f"Solo {len(ids)} estudiantes con bitácoras: no alcanzan para la grilla.")
+
+        X_colores, scaler, X_colores_scaled = matriz_colores(
+            [conteos[pk][1] for pk in ids], [conteos[pk][2] for pk in ids],
+        )
+        riesgo_score = X_colores['riesgo_score'].to_numpy()
+
+        manuales = dict(Estudiante.objects.filter(
+            pk__in=ids, nivel_riesgo_manual__isnull=False
+        ).values_list('pk', 'nivel_riesgo_manual'))
+        niveles_hitl = np.array([manuales.get(pk, -1) for pk in ids])
+
+        self.stdout.write(f"📊 {len(ids)} estudiantes con bitácoras ({len(manuales)} con etiqueta manual).")
+
+        # ── TF-IDF: una vez por max_features, en caché ──
+        memoria = Memory(None if options['sin_cache'] else RUTA_CACHE, verbose=0)
+        vectorizar = memoria.cache(vectorizar_tfidf)
+        matrices = {}
+        for max_features in sorted(set(options['max_features'])):
+            matrices[max_features] = vectorizar(documentos, max_features)
+            self.stdout.write(f"   TF-IDF max_features={max_features}: {matrices[max_features][1].shape[1]} términos")
+        if not options['sin_cache']:
+            # Las matrices de textos que ya no existen quedarían para siempre: se recorta por LRU
+            memoria.reduce_size(bytes_limit=max(0, options['cache_mb']) * 1024 * 1024)
+
+        # ── Grilla en paralelo ──
+        configs = list(product(
+            sorted(set(options['max_features'])), sorted(set(options['pesos_texto'])), sorted(set(options['clusters'])),
+        ))
+        self.stdout.write(f"🤖 Evaluando {len(configs)} configuraciones...")
+        resultados = Parallel(n_jobs=options['workers'])(
+            delayed(evaluar_config)(
+                X_colores_scaled, riesgo_score, matrices[max_features][1], niveles_hitl, peso_texto, n_clusters,
+            )
+            for max_features, peso_texto, n_clusters in configs
+        )
+        for (max_features, peso_texto, n_clusters), resultado in zip(configs, resultados):
+            resultado.update(max_features=max_features, peso_texto=peso_texto, n_clusters=n_clusters)
+
+        resultados.sort(key=lambda r: _clave_orden(r, options['criterio']), reverse=True)
+        for resultado in resultados:
+            silueta = f"{resultado['silueta']:.3f}" if resultado['silueta'] is not None else "—"
+            acuerdo = f"{resultado['acuerdo_hitl']:.0%}" if resultado['acuerdo_hitl'] is not None else "—"
+            self.stdout.write(
+                f"   max_features={resultado['max_features']:<4} texto x{resultado['peso_texto']:<4} "
+                f"k={resultado['n_clusters']} | silueta {silueta} | HITL {acuerdo} | "
+                f"niveles {resultado['tamanos']}"
+            )
+
+        mejor = resultados[0]
+        self.stdout.write(self.style.SUCCESS(
+            f"🏆 Mejor ({options['criterio']}): max_features={mejor['max_features']}, "
+            f"texto x{mejor['peso_texto']}, k={mejor['n_clusters']} "
+            f"({time.perf_counter() - inicio:.1f}s)"
+        ))
+
+        if options['exportar']:
+            cerebro = {
+                'model': mejor['kmeans'],
+                'scaler': scaler,
+                'tfidf': matrices[mejor['max_features']][0],
+                'mapa_orden': mejor['mapa_orden'],
+            }
+            version = exportar_artefacto(
+                cerebro, options['salida'], peso_colores=PESO_COLORES, peso_texto=mejor['peso_texto'],
+                orden_riesgo=ORDEN_RIESGO,
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"📦 Artefacto {version} guardado en {options['salida']}.npz/.json"
+            ))
+            if options['salida'] == RUTA_ARTEFACTO:
+                self.stdout.write("   Ejecuta recalcular_riesgos_batch --full para aplicarlo.")
@@ -0,0 +1,134 @@
+"""
+Management Command: procesar_trabajos_recalculo
+===============================================
+Worker de la cola de recálculos masivos (tabla trabajo_recalculo).
+
+La vista recalcular_riesgo_masivo solo encola el trabajo y responde de inmediato;
+este proceso lo ejecuta fuera de gunicorn e informa el avance en la misma fila,
+que el dashboard consulta por AJAX (vista estado_recalculo_masivo).
+
+Uso:
+    python manage.py procesar_trabajos_recalculo             # queda escuchando la cola
+    python manage.py procesar_trabajos_recalculo --una-vez   # procesa lo pendiente y termina
+
+Debe correr como proceso aparte (ver Procfile / docker-compose.yml). Cada avance renueva
+el latido del trabajo; si el worker muere, el trabajo vuelve a la cola pasados
+TrabajoRecalculo.VENCIMIENTO_LATIDO (ver TrabajoRecalculo.liberar_vencidos).
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from sat.models import Estudiante, Notificacion, TrabajoRecalculo
+
+# Cada cuántos estudiantes se guarda el avance en la fila del trabajo
+INTERVALO_PROGRESO = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa la cola de recálculos masivos de riesgo IA encolados desde el dashboard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesa los trabajos pendientes y termina (sin quedar escuchando).',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2.0,
+            help='Segundos de espera entre consultas a la cola cuando está vacía (por defecto 2).',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("👷 Worker de recálculo masivo iniciado.")
+        try:
+            while True:
+                # Conexiones caídas o vencidas (CONN_MAX_AGE) entre vueltas del loop
+                close_old_connections()
+                trabajo = TrabajoRecalculo.tomar_siguiente()
+                if trabajo is None:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+                self.ejecutar(trabajo)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("Worker detenido."))
+
+    def ejecutar(self, trabajo):
+        from sat.services import obtener_predictor, CAMPOS_DETALLE_IA, TAMANO_BLOQUE, guardar_detalle_ia
+
+        self.stdout.write(f"🚀 {trabajo}")
+        try:
+            predictor = obtener_predictor()
+            if not predictor.cerebro:
+                raise RuntimeError("El modelo IA no está disponible.")
+
+            qs = Estudiante.objects.all()
+            if trabajo.carrera_id:
+                qs = qs.filter(carrera_id=trabajo.carrera_id)
+            trabajo.total = qs.count()
+            trabajo.registrar_avance()
+
+            sin_cambio_lista = []
+            for estudiante, nuevo_riesgo in predictor.iterar_predicciones(qs):
+                try:
+                    if nuevo_riesgo is None:
+                        # Falló la predicción de su bloque: no se guarda nada
+                        raise ValueError("no se pudo predecir")
+                    hubo_cambio_riesgo = nuevo_riesgo != estudiante.nivel_riesgo_ia
+                    tiene_override = estudiante.riesgo_sobrescrito
+
+                    if hubo_cambio_riesgo or tiene_override:
+                        estudiante.nivel_riesgo_ia = nuevo_riesgo
+                        campos = ['nivel_riesgo_ia'] + CAMPOS_DETALLE_IA
+                        if tiene_override:
+                            # La IA toma el control; la etiqueta manual queda preservada en nivel_riesgo_manual
+                            estudiante.riesgo_sobrescrito = False
+                            campos.append('riesgo_sobrescrito')
+                        estudiante.save(update_fields=campos)
+                        trabajo.actualizados += 1
+                    else:
+                        sin_cambio_lista.append(estudiante)
+                        trabajo.sin_cambio += 1
+                except Exception:
+                    trabajo.errores += 1
+
+                # El detalle IA de los sin cambio se guarda por bloque (memoria acotada y nada
+                # se pierde si el worker se cae más adelante)
+                if len(sin_cambio_lista) >= TAMANO_BLOQUE:
+                    guardar_detalle_ia(sin_cambio_lista)
+                    sin_cambio_lista = []
+
+                trabajo.procesados += 1
+                if trabajo.procesados % INTERVALO_PROGRESO == 0:
+                    trabajo.registrar_avance()
+
+            guardar_detalle_ia(sin_cambio_lista)
+            trabajo.estado = 'OK'
+        except Exception as e:
+            trabajo.estado = 'ER'
+            trabajo.detalle_error = str(e)
+
+        trabajo.fecha_fin = timezone.now()
+        trabajo.save()
+        self._notificar_fin(trabajo)
+
+        estilo = self.style.SUCCESS if trabajo.estado == 'OK' else self.style.ERROR
+        self.stdout.write(estilo(f"   {trabajo.get_estado_display()}: {trabajo.resumen()}"))
+
+    def _notificar_fin(self, trabajo):
+        # Si quien lo pidió cerró el dashboard, igual se entera por la campana de notificaciones
+        if trabajo.solicitado_por_id:
+            Notificacion.objects.create(
+                destinatario_id=trabajo.solicitado_por_id,
+                actor=None,
+                mensaje=trabajo.resumen()[:255],
+            )
+
@@ -4,18 +4,160 @@ Management Command: recalcular_riesgos_batch
 Diseñado para ejecutarse en las madrugadas vía crontab.
 
 Ejemplo de crontab (3 AM todos los días):
-    0 3 * * * /ruta/venv/bin/python /ruta/manage.py recalcular_riesgos_batch
+    0 3 * * * /ruta/venv/bin/python /ruta/manage.py recalcular_riesgos_batch --incremental
+
+Con --workers N los bloques de ids se reparten en N procesos (cada uno con su
+propia conexión a la BD y el modelo ya cargado); el resumen suma los contadores.
+
+Con --bulk los cambios de cada bloque se guardan con bulk_update + un bulk_create de
+HistorialRiesgo (ver services.guardar_riesgos_lote) en vez de un save() por estudiante.
+
+Checkpoint: los ids se procesan en bloques contiguos y ordenados; cada bloque se confirma
+en su propia transacción (los locks duran lo que tarda un bloque) y el último id completado
+queda en la tabla ejecucion_batch. Si la corrida se corta (caída, reinicio), --resume sigue
+desde ese id con la fecha de inicio original. Reprocesar un bloque es idempotente.
+
+Shadow (--shadow RUTA): antes de publicar un modelo candidato (p. ej. el de
+entrenar_modelo --salida /tmp/candidato) puntúa a los mismos estudiantes con el modelo en uso
+y con el candidato, sin escribir nada en la BD, y muestra la matriz de transición
+(nivel actual → nivel candidato) por carrera y la lista de estudiantes que cambiarían.
+El formato del candidato sale de la extensión de RUTA (.pkl → solo el .pkl; si no, base del
+.npz/.json): un .pkl con un artefacto al lado no se reemplaza en silencio por el artefacto.
+
+Modos:
+  --full (por defecto)  Recalcula a todos. Usar cuando cambia el modelo.
+  --incremental         Solo estudiantes marcados en marca_recalculo (bitácoras/comentarios
+                        nuevos o editados desde el último batch). El costo escala con la
+                        actividad del día, no con el total de estudiantes.
 
 Lógica:
   1. Filtra estudiantes donde riesgo_sobrescrito=False (respeta decisiones manuales).
   2. Instancia PredictorRiesgo() UNA SOLA VEZ fuera del loop (eficiente).
-  3. Calcula el nuevo riesgo y actualiza si cambió.
+  3. Calcula el nuevo riesgo por bloques con predecir_lote (una predicción vectorizada
+     por bloque, no una por estudiante) y actualiza si cambió.
   4. La señal pre_save de Estudiante registra automáticamente el HistorialRiesgo.
+     La confianza, el nivel alternativo y los términos que explican la predicción
+     se guardan para todos (también si el nivel no cambió).
+  5. Borra las marcas de recálculo de los estudiantes procesados sin error, bloque a bloque
+     (solo las anteriores al inicio del batch: un cambio durante la corrida queda para la próxima).
 """
 
-from django.core.management.base import BaseCommand
-from sat.models import Estudiante
-from sat.services import PredictorRiesgo
+import csv
+import multiprocessing
+import os
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from sat.ml_models.artefacto import base_artefacto
+from sat.models import EjecucionBatch, Estudiante, MarcaRecalculo
+from sat.services import (
+    PredictorRiesgo, TAMANO_BLOQUE, CAMPOS_DETALLE_IA, guardar_riesgos_lote, guardar_detalle_ia,
+    comparar_predictores,
+)
+
+# Predictor del proceso. Se carga en el padre antes del fork: los workers lo heredan ya cargado.
+_predictor = None
+
+
+def _formato_candidato(ruta):
+    """
+    Formato del modelo candidato según la extensión de `ruta`: .pkl → 'pkl'; .npz, .json o
+    sin extensión conocida → 'artefacto' (base del .npz/.json). Lanza CommandError si faltan
+    los archivos de ese formato: nunca se cae al otro formato que esté al lado.
+    """
+    if os.path.splitext(ruta)[1].lower() == '.pkl':
+        formato, requeridos = 'pkl', [ruta]
+    else:
+        base = base_artefacto(ruta)
+        formato, requeridos = 'artefacto', [base + '.npz', base + '.json']
+    faltan = [archivo for archivo in requeridos if not os.path.exists(archivo)]
+    if faltan:
+        raise CommandError(
+            f"No existe {', '.join(faltan)} (--shadow con .pkl carga solo el .pkl; "
+            f"cualquier otra ruta es la base del .npz/.json)."
+        )
+    return formato
+
+
+def _procesar_bloque(ids, dry_run, bulk=False):
+    """
+    Recalcula un bloque contiguo de ids (en el proceso padre o en un worker).
+    Retorna los contadores y el detalle para que el padre arme el resumen.
+    """
+    resultado = {
+        'ultimo_id': ids[-1],
+        'actualizados': 0, 'sin_cambio': 0, 'errores': 0,
+        'procesados_ok': [], 'cambios': [], 'fallas': [],
+    }
+    # Se vuelve a filtrar por riesgo_sobrescrito: el EC pudo corregir mientras corría el batch
+    estudiantes_qs = Estudiante.objects.filter(
+        pk__in=ids, riesgo_sobrescrito=False
+    ).select_related('carrera')
+
+    # La predicción se calcula antes de abrir la transacción: los locks solo duran las escrituras
+    predicciones = list(_predictor.iterar_predicciones(estudiantes_qs))
+
+    # Todo el bloque se confirma de una vez; cada escritura va en un savepoint para que
+    # el error de un estudiante no deshaga al resto
+    with transaction.atomic():
+        pendientes_bulk = []
+        sin_cambio_lista = []
+        for estudiante, nuevo_riesgo in predicciones:
+            if nuevo_riesgo is None:
+                # Falló la predicción del bloque: no se guarda y la marca queda para la próxima corrida
+                resultado['errores'] += 1
+                resultado['fallas'].append((estudiante.rut, "no se pudo predecir su bloque"))
+                continue
+            try:
+                riesgo_anterior = estudiante.nivel_riesgo_ia
+                if nuevo_riesgo != riesgo_anterior:
+                    if bulk:
+                        pendientes_bulk.append((estudiante, nuevo_riesgo))
+                        resultado['cambios'].append((estudiante.rut, riesgo_anterior, nuevo_riesgo))
+                        continue
+                    if not dry_run:
+                        estudiante.nivel_riesgo_ia = nuevo_riesgo
+                        # update_fields dispara la señal pre_save → crea HistorialRiesgo automáticamente
+                        with transaction.atomic():
+                            estudiante.save(update_fields=['nivel_riesgo_ia'] + CAMPOS_DETALLE_IA)
+                    resultado['cambios'].append((estudiante.rut, riesgo_anterior, nuevo_riesgo))
+                    resultado['actualizados'] += 1
+                else:
+                    sin_cambio_lista.append(estudiante)
+                    resultado['sin_cambio'] += 1
+                resultado['procesados_ok'].append(estudiante.pk)
+
+            except Exception as e:
+                resultado['errores'] += 1
+                resultado['fallas'].append((getattr(estudiante, 'rut', '?'), str(e)))
+
+        if pendientes_bulk:
+            try:
+                if not dry_run:
+                    guardar_riesgos_lote(pendientes_bulk)
+                resultado['actualizados'] += len(pendientes_bulk)
+                resultado['procesados_ok'].extend(e.pk for e, _ in pendientes_bulk)
+            except Exception as e:
+                # Los cambios del bloque van en un solo savepoint: si falla, no se aplicó ninguno
+                resultado['errores'] += len(pendientes_bulk)
+                resultado['cambios'] = []
+                resultado['fallas'].extend((est.rut, str(e)) for est, _ in pendientes_bulk)
+
+        # Aunque el nivel no cambie, la confianza y los términos sí pueden moverse (sin historial ni señales)
+        if sin_cambio_lista and not dry_run:
+            try:
+                with transaction.atomic():
+                    guardar_detalle_ia(sin_cambio_lista)
+            except Exception as e:
+                resultado['fallas'].append(('(detalle IA del bloque)', str(e)))
+
+    return resultado
+
+
+def _procesar_bloque_worker(args):
+    return _procesar_bloque(*args)
 
 
 class Command(BaseCommand):
@@ -30,13 +172,76 @@ class Command(BaseCommand):
             action='store_true',
             help='Simula la ejecución sin guardar cambios en la base de datos.',
         )
+        modo = parser.add_mutually_exclusive_group()
+        modo.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Solo recalcula estudiantes con bitácoras/comentarios nuevos desde el último batch.',
+        )
+        modo.add_argument(
+            '--full',
+            action='store_true',
+            help='Recalcula a todos los estudiantes (por defecto). Usar cuando cambia el modelo.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Cantidad de procesos en paralelo (por defecto 1, sin multiproceso).',
+        )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Guarda los cambios de cada bloque con bulk_update y un bulk_create de historial.',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continúa la última corrida del mismo modo que quedó sin terminar, desde su último id completado.',
+        )
+        parser.add_argument(
+            '--tamano-bloque',
+            type=int,
+            default=TAMANO_BLOQUE,
+            help=f'Estudiantes por bloque/transacción (por defecto {TAMANO_BLOQUE}).',
+        )
+        parser.add_argument(
+            '--shadow',
+            metavar='RUTA',
+            help=(
+                'Compara el modelo en uso con el candidato en RUTA sin escribir en la BD. '
+                'El formato sale de la extensión: .pkl, o base del .npz/.json.'
+            ),
+        )
+        parser.add_argument(
+            '--shadow-csv',
+            metavar='RUTA',
+            help='Con --shadow, guarda además la lista de estudiantes que cambian de nivel en un CSV.',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
+        incremental = options['incremental']
+        modo = 'IN' if incremental else 'FU'
+        tamano_bloque = max(1, options['tamano_bloque'])
+        formato_candidato = _formato_candidato(options['shadow']) if options['shadow'] else None
 
-        if dry_run:
+        # ── Checkpoint: corrida nueva o la que quedó sin terminar ─────────
+        ejecucion = None
+        if options['resume'] and not options['shadow']:
+            ejecucion = EjecucionBatch.pendiente(modo)
+            if ejecucion is None:
+                self.stdout.write(self.style.WARNING(
+                    "⚠️  No hay una corrida sin terminar de este modo: se inicia una nueva."
+                ))
+        if dry_run and not options['shadow']:
             self.stdout.write(self.style.WARNING("⚠️  MODO DRY-RUN: no se guardarán cambios.\n"))
 
+        # Las marcas creadas después de este instante se conservan para la próxima corrida
+        # (al reanudar se usa el inicio de la corrida original)
+        inicio_batch = ejecucion.fecha_inicio if ejecucion else timezone.now()
+        desde_id = ejecucion.ultimo_id if ejecucion else 0
+
         # ── Contadores para el resumen final ──────────────────────────────
         total = 0
         actualizados = 0
@@ -45,15 +250,17 @@ class Command(BaseCommand):
         omitidos_sobrescritos = 0
 
         # ── Cargar el predictor UNA SOLA VEZ (evita recargar el modelo en cada iter) ──
+        global _predictor
         try:
-            predictor = PredictorRiesgo()
+            # --dry-run y --shadow no escriben nada, tampoco en el feature store
+            predictor = _predictor = PredictorRiesgo(guardar_features=not (dry_run or options['shadow']))
         except Exception as e:
             self.stderr.write(self.style.ERROR(f"❌ No se pudo cargar el modelo IA: {e}"))
             return
 
         if not predictor.cerebro:
             self.stderr.write(self.style.ERROR(
-                "❌ El modelo IA no está disponible. Verifica la ruta del archivo .pkl."
+                "❌ El modelo IA no está disponible. Verifica el artefacto (.npz/.json) o el .pkl."
             ))
             return
 
@@ -62,42 +269,98 @@ class Command(BaseCommand):
 
         # ── Filtrar solo estudiantes sin sobrescritura manual ─────────────
         estudiantes_qs = Estudiante.objects.filter(
-            riesgo_sobrescrito=False
+            riesgo_sobrescrito=False, pk__gt=desde_id
         ).select_related('carrera')  # Optimiza queries si el predictor consulta carrera
 
-        total = estudiantes_qs.count()
+        if incremental:
+            estudiantes_qs = estudiantes_qs.filter(
+                pk__in=MarcaRecalculo.objects.values('estudiante_id')
+            )
+
+        ids = list(estudiantes_qs.order_by('pk').values_list('pk', flat=True))
+        total = len(ids)
+
+        if options['shadow']:
+            self._shadow(predictor, options['shadow'], formato_candidato, ids, tamano_bloque, options['shadow_csv'])
+            return
+
+        workers = max(1, options['workers'])
+        if workers > 1 and connections['default'].vendor == 'sqlite':
+            # SQLite bloquea la BD completa por transacción: los bloques de otros workers fallarían
+            self.stdout.write(self.style.WARNING("⚠️  SQLite no admite escrituras concurrentes: se usa un solo proceso."))
+            workers = 1
+
+        if not dry_run:
+            if ejecucion is None:
+                ejecucion = EjecucionBatch.objects.create(modo=modo, fecha_inicio=inicio_batch, total=total)
+            else:
+                ejecucion.estado = 'EJ'
+                ejecucion.save(update_fields=['estado', 'fecha_actualizacion'])
+
         self.stdout.write(
-            f"🚀 Iniciando recálculo para {total} estudiantes "
-            f"({omitidos_sobrescritos} omitidos por sobrescritura manual)...\n"
+            f"🚀 Iniciando recálculo {'INCREMENTAL' if incremental else 'COMPLETO'} para {total} estudiantes "
+            f"({omitidos_sobrescritos} omitidos por sobrescritura manual)"
+            + (f" con {workers} workers" if workers > 1 else "")
+            + (f", reanudando desde el id {desde_id}" if desde_id else "") + "...\n"
         )
 
-        # ── Loop principal ────────────────────────────────────────────────
-        for estudiante in estudiantes_qs.iterator():
-            try:
-                nuevo_riesgo = predictor.predecir_estudiante(estudiante)
-
-                if nuevo_riesgo != estudiante.nivel_riesgo_ia:
-                    if not dry_run:
-                        estudiante.nivel_riesgo_ia = nuevo_riesgo
-                        # update_fields dispara la señal pre_save → crea HistorialRiesgo automáticamente
-                        estudiante.save(update_fields=['nivel_riesgo_ia'])
+        # ── Loop principal (predicción vectorizada por bloques contiguos de ids) ──
+        tareas = [(ids[i:i + tamano_bloque], dry_run, options['bulk']) for i in range(0, total, tamano_bloque)]
+        # Con workers los bloques terminan en cualquier orden: el checkpoint solo avanza
+        # hasta el último bloque con todos los anteriores ya completados
+        indice_de_bloque = {tarea[0][-1]: i for i, tarea in enumerate(tareas)}
+        completados = set()
+        siguiente = 0
+        try:
+            for resultado in self._ejecutar(tareas, workers):
+                actualizados += resultado['actualizados']
+                sin_cambio += resultado['sin_cambio']
+                errores += resultado['errores']
 
+                for rut, anterior, nuevo in resultado['cambios']:
                     self.stdout.write(
                         self.style.SUCCESS(
-                            f"  ✅ {estudiante.rut} | "
-                            f"{estudiante.nivel_riesgo_ia} → {nuevo_riesgo}"
-                            + (" [DRY-RUN]" if dry_run else "")
+                            f"  ✅ {rut} | {anterior} → {nuevo}" + (" [DRY-RUN]" if dry_run else "")
                         )
                     )
-                    actualizados += 1
-                else:
-                    sin_cambio += 1
+                for rut, error in resultado['fallas']:
+                    self.stderr.write(self.style.ERROR(f"  ❌ Error en {rut}: {error}"))
 
-            except Exception as e:
-                errores += 1
-                self.stderr.write(
-                    self.style.ERROR(f"  ❌ Error en {getattr(estudiante, 'rut', '?')}: {e}")
-                )
+                if dry_run:
+                    continue
+
+                # ── Limpiar marcas de los procesados del bloque ya confirmado ──
+                self._limpiar_marcas(resultado['procesados_ok'], inicio_batch)
+
+                completados.add(indice_de_bloque[resultado['ultimo_id']])
+                while siguiente in completados:
+                    ejecucion.ultimo_id = tareas[siguiente][0][-1]
+                    siguiente += 1
+                ejecucion.procesados += resultado['actualizados'] + resultado['sin_cambio'] + resultado['errores']
+                ejecucion.actualizados += resultado['actualizados']
+                ejecucion.sin_cambio += resultado['sin_cambio']
+                ejecucion.errores += resultado['errores']
+                ejecucion.save(update_fields=[
+                    'ultimo_id', 'procesados', 'actualizados', 'sin_cambio', 'errores', 'fecha_actualizacion',
+                ])
+        except BaseException:
+            # Ctrl+C o error: la corrida queda reanudable desde ultimo_id
+            if ejecucion is not None:
+                ejecucion.estado = 'IT'
+                ejecucion.save(update_fields=['estado', 'fecha_actualizacion'])
+                self.stderr.write(self.style.ERROR(
+                    f"⛔ Batch interrumpido en el id {ejecucion.ultimo_id}. Reanudar con --resume."
+                ))
+            raise
+
+        # ── Los sobrescritos no se recalculan: sus marcas también se limpian ──
+        if not dry_run:
+            MarcaRecalculo.objects.filter(
+                estudiante__riesgo_sobrescrito=True, fecha_marca__lte=inicio_batch
+            ).delete()
+            ejecucion.estado = 'OK'
+            ejecucion.fecha_fin = timezone.now()
+            ejecucion.save(update_fields=['estado', 'fecha_fin', 'fecha_actualizacion'])
 
         # ── Resumen final ─────────────────────────────────────────────────
         self.stdout.write("\n" + "─" * 50)
@@ -108,9 +371,86 @@ class Command(BaseCommand):
         self.stdout.write(self.style.WARNING(f"   Omitidos (manual)      : {omitidos_sobrescritos}"))
         if errores:
             self.stdout.write(self.style.ERROR(f"   Errores                : {errores}"))
+        if desde_id and ejecucion is not None:
+            self.stdout.write(f"   Corrida completa       : {ejecucion.procesados} procesados, {ejecucion.actualizados} actualizados")
         self.stdout.write("─" * 50 + "\n")
 
         if dry_run:
             self.stdout.write(self.style.WARNING("⚠️  DRY-RUN completado. No se modificó la BD."))
         else:
             self.stdout.write(self.style.SUCCESS("✅ Batch completado exitosamente."))
+
+    def _shadow(self, predictor, ruta_candidato, formato, ids, tamano_bloque, ruta_csv=None):
+        """Puntúa `ids` con el modelo en uso y con el candidato y reporta las transiciones (solo lectura)."""
+        candidato = PredictorRiesgo(ruta_candidato, usar_feature_store=False, formato=formato)
+        if not candidato.cerebro:
+            raise CommandError(f"No se pudo cargar el modelo candidato ({formato}) desde {ruta_candidato}.")
+
+        self.stdout.write(
+            f"🔍 SHADOW: modelo en uso {predictor.version_modelo} vs candidato {candidato.version_modelo} "
+            f"para {len(ids)} estudiantes (no se escribe en la BD)...\n"
+        )
+        transiciones = defaultdict(Counter)  # carrera → {(nivel actual, nivel candidato): estudiantes}
+        afectados = []
+        for inicio in range(0, len(ids), tamano_bloque):
+            bloque = ids[inicio:inicio + tamano_bloque]
+            niveles = comparar_predictores(predictor, candidato, bloque)
+            datos = Estudiante.objects.filter(pk__in=bloque).values_list('pk', 'rut', 'carrera__nombre')
+            for pk, rut, carrera in datos:
+                anterior, nuevo = niveles[pk]
+                transiciones[carrera or 'Sin carrera'][(anterior, nuevo)] += 1
+                if anterior != nuevo:
+                    afectados.append((rut, carrera or 'Sin carrera', anterior, nuevo))
+
+        # ── Matriz de transición por carrera (filas: en uso, columnas: candidato) ──
+        niveles_vistos = sorted({nivel for conteo in transiciones.values() for par in conteo for nivel in par})
+        for carrera in sorted(transiciones):
+            conteo = transiciones[carrera]
+            cambian = sum(n for (anterior, nuevo), n in conteo.items() if anterior != nuevo)
+            self.stdout.write(f"📚 {carrera} | {sum(conteo.values())} estudiantes | {cambian} cambian")
+            self.stdout.write("   en uso ↓ / candidato →" + "".join(f"{nivel:>7}" for nivel in niveles_vistos))
+            for anterior in niveles_vistos:
+                self.stdout.write(
+                    f"   {anterior:>22}" + "".join(f"{conteo[(anterior, nuevo)]:>7}" for nuevo in niveles_vistos)
+                )
+
+        # ── Estudiantes afectados ──
+        afectados.sort(key=lambda fila: (fila[1], fila[0]))
+        if afectados:
+            self.stdout.write("\nEstudiantes que cambiarían de nivel:")
+        for rut, carrera, anterior, nuevo in afectados:
+            self.stdout.write(f"  🔄 {rut} | {carrera} | {anterior} → {nuevo}")
+        if ruta_csv:
+            with open(ruta_csv, 'w', newline='', encoding='utf-8') as f:
+                escritor = csv.writer(f)
+                escritor.writerow(['rut', 'carrera', 'nivel_actual', 'nivel_candidato'])
+                escritor.writerows(afectados)
+            self.stdout.write(f"💾 Lista guardada en {ruta_csv}")
+
+        suben = sum(1 for _, _, anterior, nuevo in afectados if nuevo > anterior)
+        self.stdout.write("\n" + "─" * 50)
+        self.stdout.write("📊 RESUMEN SHADOW")
+        self.stdout.write(f"   Estudiantes            : {len(ids)}")
+        self.stdout.write(self.style.WARNING(f"   Cambiarían de nivel    : {len(afectados)} ({suben} suben, {len(afectados) - suben} bajan)"))
+        self.stdout.write("─" * 50 + "\n")
+        self.stdout.write(self.style.SUCCESS("✅ Shadow completado. No se modificó la BD."))
+
+    def _ejecutar(self, tareas, workers):
+        """Procesa las tareas en este proceso o repartidas en un pool de `workers` procesos."""
+        if workers == 1 or len(tareas) <= 1:
+            for tarea in tareas:
+                yield _procesar_bloque(*tarea)
+            return
+
+        # Las conexiones abiertas no se pueden compartir con los hijos: cada worker abre la suya
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(processes=workers) as pool:
+            for resultado in pool.imap_unordered(_procesar_bloque_worker, tareas):
+                yield resultado
+
+    def _limpiar_marcas(self, ids, inicio_batch):
+        for inicio in range(0, len(ids), TAMANO_BLOQUE):
+            MarcaRecalculo.objects.filter(
+                estudiante_id__in=ids[inicio:inicio + TAMANO_BLOQUE],
+                fecha_marca__lte=inicio_batch,
+            ).delete()
@@ -0,0 +1,214 @@
+"""
+Management Command: reentrenar_modelo
+=====================================
+Reentrenamiento en caliente del modelo de riesgo: KMeans parte desde los centroides del
+artefacto en uso (una sola inicialización, como KMeans(init=centroides, n_init=1)) en vez
+de 20 inicializaciones al azar, y usa las correcciones de los Encargados como restricción.
+
+  1. El vocabulario TF-IDF, el idf y el scaler quedan congelados: se reentrena sobre las
+     features de todos los estudiantes con bitácoras (feature store), en el mismo espacio.
+     Publicar no cambia la versión de la featurización, así que esas filas siguen vigentes.
+  2. Estudiantes con nivel_riesgo_manual: quedan fijos en el cluster de ese nivel
+     (mapa_orden inverso) durante todas las iteraciones y arrastran su centroide.
+  3. Sin etiquetas manuales (o con --sin-etiquetas) es el Lloyd estándar de KMeans.
+  4. Con etiquetas se conserva mapa_orden (las etiquetas fijan qué nivel es cada cluster);
+     sin etiquetas se recalcula por riesgo_score, igual que actualizar_modelo_online.
+  5. Deja un checkpoint versionado en sat/ml_models/checkpoints/; con --publicar además
+     reemplaza el artefacto en uso. La masa de cada centroide queda en 'conteos' y la
+     fecha en meta['online'], así el aprendizaje online sigue desde este punto.
+
+Uso:
+    python manage.py reentrenar_modelo              # solo checkpoint
+    python manage.py reentrenar_modelo --publicar   # checkpoint + artefacto en uso
+    python manage.py reentrenar_modelo --dry-run    # solo muestra el resumen
+"""
+
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sat.management.commands.actualizar_modelo_online import calcular_mapa_orden, RUTA_CHECKPOINTS
+from sat.ml_models.artefacto import leer_artefacto, guardar_artefacto
+from sat.models import Estudiante
+from sat.services import PredictorRiesgo, RUTA_ARTEFACTO, TAMANO_BLOQUE
+
+
+def kmeans_restringido(X, centroides, etiquetas, max_iter=300, tol=1e-4):
+    """
+    Lloyd desde `centroides`, con las filas donde etiquetas >= 0 fijas en ese cluster.
+    `tol` es relativa a la varianza media de X (mismo criterio que sklearn.cluster.KMeans).
+    Retorna (centroides, asignacion, iteraciones, inercia, convergio).
+    """
+    centroides = np.array(centroides, dtype=np.float64)
+    k = centroides.shape[0]
+    fijas = etiquetas >= 0
+    tolerancia = tol * X.var(axis=0).mean()
+    norma_x = (X ** 2).sum(axis=1)
+
+    asignacion = None
+    convergio = False
+    for iteracion in range(1, max_iter + 1):
+        distancias = norma_x[:, None] - 2 * (X @ centroides.T) + (centroides ** 2).sum(axis=1)[None, :]
+        nueva = distancias.argmin(axis=1)
+        nueva[fijas] = etiquetas[fijas]
+
+        conteos = np.bincount(nueva, minlength=k)
+        sumas = np.zeros_like(centroides)
+        np.add.at(sumas, nueva, X)
+        # Cluster vacío: conserva su centroide anterior (no se reasigna, su nivel sigue igual)
+        vacios = conteos == 0
+        nuevos = np.where(vacios[:, None], centroides, sumas / np.maximum(conteos, 1)[:, None])
+
+        desplazamiento = ((nuevos - centroides) ** 2).sum()
+        sin_cambios = asignacion is not None and np.array_equal(nueva, asignacion)
+        centroides, asignacion = nuevos, nueva
+        if sin_cambios or desplazamiento <= tolerancia:
+            convergio = True
+            break
+
+    inercia = float(((X - centroides[asignacion]) ** 2).sum())
+    return centroides, asignacion, iteracion, inercia, convergio
+
+
+class Command(BaseCommand):
+    help = (
+        "Reentrena el modelo IA partiendo de los centroides del artefacto en uso, "
+        "con las correcciones manuales (nivel_riesgo_manual) como restricción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-iter',
+            type=int,
+            default=300,
+            help='Máximo de iteraciones de KMeans (por defecto 300).',
+        )
+        parser.add_argument(
+            '--sin-etiquetas',
+            action='store_true',
+            help='No usa nivel_riesgo_manual (KMeans estándar desde los centroides actuales).',
+        )
+        parser.add_argument(
+            '--publicar',
+            action='store_true',
+            help='Además del checkpoint, reemplaza el artefacto en uso (sat/ml_models/modelo_sat.npz/.json).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Reentrena y muestra el resumen sin escribir archivos.',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        hasta = timezone.now()
+
+        try:
+            arreglos, meta = leer_artefacto(RUTA_ARTEFACTO)
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f"❌ No se pudo leer el artefacto compacto: {e}"))
+            return
+
+        predictor = PredictorRiesgo(guardar_features=not options['dry_run'])
+        if predictor.motor is None or predictor.version_modelo != meta['version_modelo']:
+            self.stderr.write(self.style.ERROR("❌ El predictor no cargó el artefacto compacto en uso."))
+            return
+
+        # ── Matriz de entrenamiento (mismo espacio que los centroides) ──
+        todos = list(Estudiante.objects.order_by('pk').values_list('pk', flat=True))
+        ids, bloques = [], []
+        for i in range(0, len(todos), TAMANO_BLOQUE):
+            ids_bloque, X_bloque = predictor.matriz_ponderada(todos[i:i + TAMANO_BLOQUE])
+            ids.extend(ids_bloque)
+            bloques.append(X_bloque)
+        if not ids:
+            self.stdout.write(self.style.WARNING("⚠️  No hay estudiantes con bitácoras. El modelo no cambia."))
+            return
+        X = np.vstack(bloques)
+
+        # ── Etiquetas HITL: nivel manual → cluster que hoy representa ese nivel ──
+        centroides = arreglos['centroides']
+        k = centroides.shape[0]
+        mapa_anterior = {int(c): n for c, n in meta['mapa_orden'].items()}
+        cluster_de_nivel = {n: c for c, n in mapa_anterior.items()}
+        etiquetas = np.full(len(ids), -1, dtype=np.intp)
+        if not options['sin_etiquetas']:
+            posicion = {pk: i for i, pk in enumerate(ids)}
+            manuales = Estudiante.objects.filter(
+                pk__in=ids, nivel_riesgo_manual__isnull=False
+            ).values_list('pk', 'nivel_riesgo_manual')
+            for pk, nivel in manuales:
+                if nivel in cluster_de_nivel:
+                    etiquetas[posicion[pk]] = cluster_de_nivel[nivel]
+        n_etiquetados = int((etiquetas >= 0).sum())
+
+        nuevos, asignacion, iteraciones, inercia, convergio = kmeans_restringido(
+            X, centroides, etiquetas, max_iter=max(1, options['max_iter'])
+        )
+        conteos = np.bincount(asignacion, minlength=k).astype(np.float64)
+        desplazamiento = np.sqrt(((nuevos - centroides) ** 2).sum(axis=1))
+
+        mapa_orden = calcular_mapa_orden(nuevos, arreglos, meta)
+        if n_etiquetados and mapa_orden != mapa_anterior:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  Por riesgo_score el orden sería {mapa_orden}; se conserva {mapa_anterior} "
+                f"porque las etiquetas manuales fijan el nivel de cada cluster."
+            ))
+            mapa_orden = mapa_anterior
+
+        self.stdout.write(
+            f"🧠 Modelo {meta['version_modelo']} | {len(ids)} estudiantes "
+            f"({n_etiquetados} con etiqueta manual)"
+        )
+        estilo = self.style.SUCCESS if convergio else self.style.WARNING
+        self.stdout.write(estilo(
+            f"   {'Convergió en' if convergio else 'Sin converger tras'} {iteraciones} iteraciones | "
+            f"inercia {inercia:.2f} | {time.perf_counter() - inicio:.1f}s"
+        ))
+        for cluster_id in sorted(mapa_orden, key=mapa_orden.get):
+            self.stdout.write(
+                f"   Cluster {cluster_id} → nivel {mapa_orden[cluster_id]} | "
+                f"estudiantes {conteos[cluster_id]:.0f} | desplazamiento {desplazamiento[cluster_id]:.4f}"
+            )
+        if mapa_orden != mapa_anterior:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  El orden de riesgo de los clusters cambió: {mapa_anterior} → {mapa_orden}"
+            ))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("⚠️  DRY-RUN: no se escribió ningún archivo."))
+            return
+
+        arreglos = dict(arreglos, centroides=nuevos, conteos=conteos)
+        meta = dict(
+            meta,
+            mapa_orden={str(c): n for c, n in mapa_orden.items()},
+            # El aprendizaje online sigue con las bitácoras posteriores a este reentrenamiento
+            online={'hasta': hasta.isoformat()},
+            reentrenamiento={
+                'fecha': hasta.isoformat(),
+                'estudiantes': len(ids),
+                'etiquetados': n_etiquetados,
+                'iteraciones': iteraciones,
+                'inercia': inercia,
+                'version_anterior': meta['version_modelo'],
+            },
+        )
+
+        os.makedirs(RUTA_CHECKPOINTS, exist_ok=True)
+        ruta_checkpoint = os.path.join(RUTA_CHECKPOINTS, f"modelo_sat_{hasta:%Y%m%d_%H%M%S}")
+        version = guardar_artefacto(arreglos, meta, ruta_checkpoint)
+        self.stdout.write(self.style.SUCCESS(f"📦 Checkpoint {version} guardado en {ruta_checkpoint}.npz/.json"))
+
+        if options['publicar']:
+            guardar_artefacto(arreglos, meta, RUTA_ARTEFACTO)
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Artefacto en uso actualizado a {version}. Ejecuta recalcular_riesgos_batch --full para aplicarlo."
+            ))
+            self.stdout.write(
+                f"   Featurización {predictor.version_featurizacion} sin cambios: el batch reutiliza el "
+                f"feature store y no vuelve a vectorizar."
+            )
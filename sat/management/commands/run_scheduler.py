@@ -10,10 +10,10 @@ from django.core.management import call_command
 logger = logging.getLogger(__name__)
 
 def my_job():
-    """Ejecuta el recálculo masivo."""
+    """Ejecuta el recálculo incremental (solo estudiantes con actividad desde la última corrida)."""
     try:
-        logger.info("⏳ Iniciando tarea programada: recalcular_riesgos_batch...")
-        call_command('recalcular_riesgos_batch')
+        logger.info("⏳ Iniciando tarea programada: recalcular_riesgos_batch --incremental --bulk...")
+        call_command('recalcular_riesgos_batch', incremental=True, bulk=True)
         logger.info("✅ Tarea completada con éxito.")
     except Exception as e:
         logger.error(f"❌ Error al ejecutar tarea programada: {e}")
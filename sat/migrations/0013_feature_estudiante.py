@@ -0,0 +1,31 @@
+# Generated by Django 3.2.6 on 2026-10-18 06:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sat', '0012_alter_bitacora_estado_atencion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeatureEstudiante',
+            fields=[
+                ('estudiante', models.OneToOneField(db_column='id_estudiante', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='features_ia', serialize=False, to='sat.estudiante')),
+                ('version_modelo', models.CharField(help_text='Versión del modelo con que se vectorizó (si no coincide, se recalcula)', max_length=64)),
+                ('cant_bitacoras', models.IntegerField(default=0)),
+                ('cant_rojos', models.IntegerField(default=0)),
+                ('cant_amarillos', models.IntegerField(default=0)),
+                ('vector_tfidf', models.JSONField(default=dict, help_text='Fila TF-IDF dispersa: {"indices": [...], "valores": [...]}')),
+                ('fecha_calculo', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Features IA de estudiante',
+                'verbose_name_plural': 'Features IA de estudiantes',
+                'db_table': 'feature_estudiante',
+            },
+        ),
+    ]
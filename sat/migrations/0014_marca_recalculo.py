@@ -0,0 +1,39 @@
+# Generated by Django 3.2.6 on 2026-10-18 06:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def marcar_todos(apps, schema_editor):
+    # Sin marcas previas, el primer batch --incremental debe cubrir a todos los estudiantes
+    Estudiante = apps.get_model('sat', 'Estudiante')
+    MarcaRecalculo = apps.get_model('sat', 'MarcaRecalculo')
+    ahora = django.utils.timezone.now()
+    MarcaRecalculo.objects.bulk_create(
+        [MarcaRecalculo(estudiante_id=pk, fecha_marca=ahora) for pk in Estudiante.objects.values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sat', '0013_feature_estudiante'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaRecalculo',
+            fields=[
+                ('estudiante', models.OneToOneField(db_column='id_estudiante', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='marca_recalculo', serialize=False, to='sat.estudiante')),
+                ('fecha_marca', models.DateTimeField(default=django.utils.timezone.now, help_text='Último cambio detectado (se borra solo si el batch empezó después de esta fecha)')),
+            ],
+            options={
+                'verbose_name': 'Marca de recálculo',
+                'verbose_name_plural': 'Marcas de recálculo',
+                'db_table': 'marca_recalculo',
+            },
+        ),
+        migrations.RunPython(marcar_todos, migrations.RunPython.noop),
+    ]
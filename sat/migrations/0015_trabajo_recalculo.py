@@ -0,0 +1,38 @@
+# Generated by Django 3.2.6 on 2026-10-18 06:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sat', '0014_marca_recalculo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoRecalculo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('PE', 'Pendiente'), ('EJ', 'En ejecución'), ('OK', 'Completado'), ('ER', 'Error')], default='PE', max_length=2)),
+                ('total', models.IntegerField(default=0)),
+                ('procesados', models.IntegerField(default=0)),
+                ('actualizados', models.IntegerField(default=0)),
+                ('sin_cambio', models.IntegerField(default=0)),
+                ('errores', models.IntegerField(default=0)),
+                ('detalle_error', models.TextField(blank=True, default='')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('carrera', models.ForeignKey(blank=True, db_column='id_carrera', help_text='Carrera a recalcular (vacío = todos los estudiantes)', null=True, on_delete=django.db.models.deletion.CASCADE, to='sat.carrera')),
+                ('solicitado_por', models.ForeignKey(blank=True, db_column='id_usuario', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trabajos_recalculo', to='sat.usuario')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de recálculo',
+                'verbose_name_plural': 'Trabajos de recálculo',
+                'db_table': 'trabajo_recalculo',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.6 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sat', '0015_trabajo_recalculo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estudiante',
+            name='confianza_ia',
+            field=models.FloatField(blank=True, help_text='Margen entre el centroide más cercano y el segundo (0 = frontera, 1 = asignación clara)', null=True),
+        ),
+        migrations.AddField(
+            model_name='estudiante',
+            name='nivel_riesgo_ia_alternativo',
+            field=models.IntegerField(blank=True, help_text='Nivel del segundo centroide más cercano (a qué nivel estuvo cerca de caer)', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sat', '0016_confianza_ia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estudiante',
+            name='terminos_ia',
+            field=models.JSONField(blank=True, help_text='N-gramas que más acercaron al estudiante a su cluster: [["termino", aporte], ...]', null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sat', '0017_terminos_ia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EjecucionBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modo', models.CharField(choices=[('FU', 'Completo'), ('IN', 'Incremental')], max_length=2)),
+                ('estado', models.CharField(choices=[('EJ', 'En ejecución'), ('OK', 'Completada'), ('IT', 'Interrumpida')], default='EJ', max_length=2)),
+                ('ultimo_id', models.IntegerField(default=0, help_text='Último id de estudiante completado (los bloques se procesan en orden de id)')),
+                ('total', models.IntegerField(default=0)),
+                ('procesados', models.IntegerField(default=0)),
+                ('actualizados', models.IntegerField(default=0)),
+                ('sin_cambio', models.IntegerField(default=0)),
+                ('errores', models.IntegerField(default=0)),
+                ('fecha_inicio', models.DateTimeField(default=django.utils.timezone.now, help_text='Inicio de la corrida original (las marcas posteriores quedan para la próxima)')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Ejecución del batch',
+                'verbose_name_plural': 'Ejecuciones del batch',
+                'db_table': 'ejecucion_batch',
+                'ordering': ['-fecha_inicio'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sat', '0018_ejecucion_batch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='featureestudiante',
+            name='fecha_calculo',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Instante en que se leyeron los textos (se descarta si hay una marca de recálculo posterior)'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.6 on 2026-10-18 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sat', '0019_feature_fecha_calculo_lectura'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajorecalculo',
+            name='fecha_latido',
+            field=models.DateTimeField(blank=True, help_text='Último avance informado por el worker', null=True),
+        ),
+        migrations.AddField(
+            model_name='trabajorecalculo',
+            name='intentos',
+            field=models.IntegerField(default=0, help_text='Veces que un worker tomó el trabajo'),
+        ),
+    ]
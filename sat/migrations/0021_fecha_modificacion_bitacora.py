@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def copiar_fechas(apps, schema_editor):
+    # Lo que ya existe no es "nuevo": parte con la fecha que ya tenía cada fila
+    apps.get_model('sat', 'Bitacora').objects.update(fecha_modificacion=F('fecha_registro'))
+    apps.get_model('sat', 'ComentarioBitacora').objects.update(fecha_modificacion=F('fecha_creacion'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sat', '0020_trabajo_recalculo_latido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitacora',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='comentariobitacora',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copiar_fechas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.6 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sat', '0021_fecha_modificacion_bitacora'),
+    ]
+
+    # Las filas existentes quedan con la versión del modelo, que no coincide con ninguna
+    # versión de featurización: el próximo batch las vuelve a calcular una sola vez
+    operations = [
+        migrations.RenameField(
+            model_name='featureestudiante',
+            old_name='version_modelo',
+            new_name='version_featurizacion',
+        ),
+        migrations.AlterField(
+            model_name='featureestudiante',
+            name='version_featurizacion',
+            field=models.CharField(help_text='Versión de la featurización con que se vectorizó (si no coincide, se recalcula)', max_length=64),
+        ),
+    ]
@@ -0,0 +1,293 @@
+"""
+Artefacto compacto del modelo SAT (sin scikit-learn ni pickle)
+==============================================================
+El modelo entrenado (KMeans + StandardScaler + TfidfVectorizer) se guarda como:
+
+  modelo_sat.npz   → arreglos numéricos: centroides, media/escala del scaler, idf y pesos.
+  modelo_sat.json  → vocabulario TF-IDF, parámetros del tokenizador, columnas numéricas y mapa_orden.
+                     Con 'featurizacion': 'hashing' no hay vocabulario (ver sat/ml_models/hashing.py).
+
+Este módulo NO importa Django ni scikit-learn: lo usan tanto los scripts de
+entrenamiento (data_analysis/) para exportar, como sat/services.py para cargar.
+
+Uso directo para convertir un .pkl existente:
+    python sat/ml_models/artefacto.py sat/ml_models/modelo_sat.pkl
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+# Subir este número si cambia la estructura de los archivos (el loader rechaza versiones desconocidas)
+VERSION_FORMATO = 1
+
+# Espera antes del primer reintento de leer_artefacto (se duplica en cada intento): da tiempo a
+# que termine el reemplazo del .npz/.json en vez de caer al .pkl a la primera
+ESPERA_REINTENTO = 0.05
+
+# Versiones del artefacto cuyos .npy se conservan en el directorio de mmap (la actual y la previa)
+VERSIONES_MMAP = 2
+
+
+# Extensiones que se quitan de la ruta recibida para obtener la base del artefacto
+EXTENSIONES_MODELO = ('.npz', '.json', '.pkl')
+
+
+def base_artefacto(ruta):
+    """
+    '.../modelo_sat' o '.../modelo_sat.npz|.json|.pkl' → '.../modelo_sat'. Solo se quitan esas
+    extensiones: una base con puntos ('/tmp/candidato.v2') se conserva tal cual.
+    """
+    base, extension = os.path.splitext(ruta)
+    return base if extension.lower() in EXTENSIONES_MODELO else ruta
+
+
+def _rutas(ruta_base):
+    """'.../modelo_sat' (con o sin extensión) → ('.../modelo_sat.npz', '.../modelo_sat.json')"""
+    base = base_artefacto(ruta_base)
+    return base + '.npz', base + '.json'
+
+
+def _idf(tfidf):
+    """
+    Vector idf que aplica tfidf.transform con el scikit-learn instalado, para que el artefacto
+    prediga exactamente lo mismo que el .pkl. Un .pkl de scikit-learn < 1.5 cargado en 1.5 solo
+    trae _idf_diag, que transform ignora (no pondera por idf): en ese caso se exporta idf = 1.
+    Volver a ponderar por idf cambia niveles de riesgo; eso se hace reentrenando, no acá.
+    """
+    try:
+        return tfidf.idf_
+    except AttributeError:
+        return np.ones(len(tfidf.vocabulary_), dtype=np.float64)
+
+
+def version_featurizacion(idf, meta):
+    """
+    Hash corto de lo que define la fila de features de un estudiante: vocabulario, idf,
+    configuración del TF-IDF / hashing y featurización. No cambia al mover centroides, conteos
+    o mapa_orden (actualizar_modelo_online, reentrenar_modelo): el feature store sigue vigente.
+    """
+    h = hashlib.sha256()
+    h.update(np.asarray(idf, dtype=np.float64).tobytes())
+    h.update(json.dumps({
+        'featurizacion': meta.get('featurizacion', 'tfidf'),
+        'tfidf': meta['tfidf'],
+        'vocabulario': meta['vocabulario'],
+    }, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()[:12]
+
+
+def exportar_artefacto(cerebro, ruta_base, peso_colores=1.0, peso_texto=1.5, orden_riesgo=None):
+    """
+    Exporta el dict que se guarda con joblib ({'model', 'scaler', 'tfidf', 'mapa_orden'}, o con
+    featurizacion='hashing': {'model', 'scaler', 'hashing', 'idf', 'mapa_orden'}) al formato
+    compacto. `peso_colores` y `peso_texto` son los multiplicadores usados al concatenar las
+    matrices en el entrenamiento. `orden_riesgo` ({'rojos_topados': 3, ...}) son los coeficientes
+    del riesgo_score con que se armó mapa_orden (lo usa el modo online para reordenar los
+    centroides). Retorna la versión del modelo (hash corto).
+    """
+    model, scaler = cerebro['model'], cerebro['scaler']
+    hashing = cerebro.get('featurizacion') == 'hashing'
+
+    columnas = [str(c) for c in getattr(scaler, 'feature_names_in_', ['rojos_topados', 'amarillos_topados'])]
+    if hashing:
+        # Sin vocabulario: la columna de cada término sale de su hash (ver sat/ml_models/hashing.py)
+        vocabulario = {}
+        idf = cerebro['idf']
+        config_texto = dict(cerebro['hashing'])
+        n_texto = config_texto['n_features']
+    else:
+        tfidf = cerebro['tfidf']
+        vocabulario = {termino: int(idx) for termino, idx in tfidf.vocabulary_.items()}
+        idf = _idf(tfidf)
+        config_texto = {
+            'lowercase': bool(tfidf.lowercase),
+            'token_pattern': tfidf.token_pattern,
+            'ngram_range': list(tfidf.ngram_range),
+            'stop_words': sorted(tfidf.get_stop_words() or []),
+            'norm': tfidf.norm,
+            'sublinear_tf': bool(tfidf.sublinear_tf),
+            'binary': bool(tfidf.binary),
+        }
+        n_texto = len(vocabulario)
+
+    arreglos = {
+        'centroides': np.asarray(model.cluster_centers_, dtype=np.float64),
+        'scaler_media': np.asarray(scaler.mean_, dtype=np.float64),
+        'scaler_escala': np.asarray(scaler.scale_, dtype=np.float64),
+        'idf': np.asarray(idf, dtype=np.float64),
+        'pesos': np.concatenate([
+            np.full(len(columnas), peso_colores, dtype=np.float64),
+            np.full(n_texto, peso_texto, dtype=np.float64),
+        ]),
+    }
+
+    meta = {
+        'version_formato': VERSION_FORMATO,
+        'columnas_numericas': columnas,
+        'mapa_orden': {str(int(k)): int(v) for k, v in cerebro['mapa_orden'].items()},
+        'tfidf': config_texto,
+        'vocabulario': vocabulario,
+    }
+    if hashing:
+        # Sin esta clave el loader asume 'tfidf' (artefactos anteriores)
+        meta['featurizacion'] = 'hashing'
+    if orden_riesgo:
+        meta['orden_riesgo'] = {str(c): float(w) for c, w in orden_riesgo.items()}
+
+    return guardar_artefacto(arreglos, meta, ruta_base)
+
+
+def guardar_artefacto(arreglos, meta, ruta_base):
+    """
+    Escribe (arreglos, meta) — por ejemplo los de leer_artefacto con los centroides
+    actualizados — y retorna la nueva versión. Los arreglos extra (p. ej. 'conteos')
+    se guardan tal cual; el loader los ignora si no los necesita.
+
+    Cada archivo se escribe en un temporal del mismo directorio y se renombra
+    (os.replace es atómico): un worker nunca lee un archivo a medio escribir.
+    """
+    arreglos = {nombre: valor for nombre, valor in arreglos.items() if nombre != 'version_modelo'}
+    meta = {
+        clave: valor for clave, valor in meta.items() if clave not in ('version_modelo', 'version_featurizacion')
+    }
+
+    # Versión = hash del contenido (mismo modelo → misma versión, sin depender de la fecha)
+    h = hashlib.sha256()
+    for nombre in sorted(arreglos):
+        h.update(arreglos[nombre].tobytes())
+    h.update(json.dumps(meta, sort_keys=True).encode('utf-8'))
+    meta['version_modelo'] = h.hexdigest()[:12]
+    # Sello del feature store: solo cambia si cambia la featurización (ver version_featurizacion)
+    meta['version_featurizacion'] = version_featurizacion(arreglos['idf'], meta)
+
+    ruta_npz, ruta_json = _rutas(ruta_base)
+    # La versión también va en el .npz: leer_artefacto detecta si leyó un par de archivos cruzado
+    _escribir_atomico(ruta_npz, lambda f: np.savez(f, version_modelo=np.array(meta['version_modelo']), **arreglos))
+    _escribir_atomico(ruta_json, lambda f: f.write(json.dumps(meta, ensure_ascii=False, indent=1).encode('utf-8')))
+
+    return meta['version_modelo']
+
+
+def _escribir_atomico(ruta, escribir):
+    """Llama escribir(archivo_binario) sobre un temporal junto a `ruta` y lo renombra a `ruta`."""
+    fd, ruta_tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(ruta)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            escribir(f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp crea el archivo con permisos 0600; se dejan los habituales (umask)
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(ruta_tmp, 0o666 & ~umask)
+        os.replace(ruta_tmp, ruta)
+    except BaseException:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+        raise
+
+
+def leer_artefacto(ruta_base, intentos=3, directorio_mmap=None):
+    """
+    Lee el artefacto y retorna (arreglos, meta). Lanza ValueError si el formato no es compatible.
+
+    Con `directorio_mmap`, cada arreglo se extrae una vez a un .npy en ese directorio y se
+    retorna mapeado en memoria (solo lectura): todos los procesos que cargan la misma versión
+    comparten las mismas páginas del page cache en vez de tener cada uno su copia.
+    """
+    ruta_npz, ruta_json = _rutas(ruta_base)
+    for intento in range(intentos):
+        if intento:
+            time.sleep(ESPERA_REINTENTO * 2 ** (intento - 1))
+        with open(ruta_json, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        if meta.get('version_formato') != VERSION_FORMATO:
+            raise ValueError(
+                f"Formato de artefacto {meta.get('version_formato')} no soportado (se esperaba {VERSION_FORMATO})."
+            )
+
+        with np.load(ruta_npz, allow_pickle=False) as datos:
+            # Artefactos anteriores no traen la versión en el .npz
+            nombres = [nombre for nombre in datos.files if nombre != 'version_modelo']
+            if 'version_modelo' in datos.files and str(datos['version_modelo']) != meta['version_modelo']:
+                # Se leyó justo entre el reemplazo del .npz y el del .json: se vuelve a leer
+                continue
+            if directorio_mmap is None:
+                arreglos = {nombre: datos[nombre] for nombre in nombres}
+            else:
+                arreglos = _mapear_arreglos(datos, nombres, meta['version_modelo'], directorio_mmap)
+        return arreglos, meta
+
+    raise ValueError("El .npz y el .json del artefacto no corresponden a la misma versión.")
+
+
+def _mapear_arreglos(datos, nombres, version, directorio):
+    """{nombre: np.memmap de solo lectura} de `<directorio>/<version>.<nombre>.npy` (se crean si faltan)."""
+    os.makedirs(directorio, exist_ok=True)
+    arreglos = {}
+    for nombre in nombres:
+        ruta = os.path.join(directorio, f"{version}.{nombre}.npy")
+        if os.path.exists(ruta):
+            try:
+                # Marca la versión como recién usada (ver _limpiar_mmap)
+                os.utime(ruta)
+                arreglos[nombre] = np.load(ruta, mmap_mode='r')
+                continue
+            except FileNotFoundError:
+                pass  # Otro proceso la borró entre el exists y el load: se vuelve a extraer
+        _escribir_atomico(ruta, lambda f: np.save(f, datos[nombre]))
+        arreglos[nombre] = np.load(ruta, mmap_mode='r')
+
+    _limpiar_mmap(directorio, version)
+    return arreglos
+
+
+def _limpiar_mmap(directorio, version):
+    """
+    Borra los .npy de las versiones usadas hace más tiempo, conservando `version` y las
+    VERSIONES_MMAP - 1 anteriores: un proceso que aún está cargando la versión previa
+    (recarga en caliente, vuelta a un checkpoint) no pierde sus archivos a mitad de camino.
+    Un proceso que ya tiene mapeada una versión borrada la sigue leyendo (el archivo vive
+    hasta que lo suelta).
+    """
+    uso = {}
+    for archivo in os.listdir(directorio):
+        if not archivo.endswith('.npy'):
+            continue
+        try:
+            modificado = os.path.getmtime(os.path.join(directorio, archivo))
+        except OSError:
+            continue
+        otra = archivo.split('.', 1)[0]
+        uso[otra] = max(uso.get(otra, 0), modificado)
+    uso.pop(version, None)
+
+    conservar = set(sorted(uso, key=uso.get, reverse=True)[:VERSIONES_MMAP - 1])
+    for archivo in os.listdir(directorio):
+        if archivo.endswith('.npy') and archivo.split('.', 1)[0] in uso.keys() - conservar:
+            try:
+                os.remove(os.path.join(directorio, archivo))
+            except OSError:
+                pass
+
+
+if __name__ == '__main__':
+    import sys
+    import joblib
+
+    if len(sys.argv) < 2:
+        print("Uso: python artefacto.py <modelo.pkl> [peso_colores] [peso_texto]")
+        sys.exit(1)
+
+    ruta_pkl = sys.argv[1]
+    peso_colores = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    peso_texto = float(sys.argv[3]) if len(sys.argv) > 3 else 1.5
+
+    version = exportar_artefacto(joblib.load(ruta_pkl), ruta_pkl, peso_colores, peso_texto)
+    print(f"✅ Artefacto exportado junto a {ruta_pkl} (versión {version}).")
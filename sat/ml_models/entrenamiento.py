@@ -0,0 +1,114 @@
+"""
+Pasos de entrenamiento del modelo SAT (compartidos)
+===================================================
+Las piezas del entrenamiento de entrenar_modelov4.py como funciones puras, para que
+manage.py entrenar_modelo y manage.py evaluar_grilla armen exactamente el mismo modelo:
+
+  matriz_colores → riesgo_score + rojos/amarillos topados, escalados (StandardScaler).
+  vectorizar_tfidf → TfidfVectorizer (max_features, stopwords de riesgo, bigramas, min_df=3).
+  ajustar_kmeans → KMeans sobre [colores * peso | texto * peso] en disperso.
+  evaluar_config → un punto de la grilla: silueta, tamaños y acuerdo con las etiquetas HITL.
+
+Este módulo NO importa Django: evaluar_config se ejecuta en procesos hijos de joblib.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .normalizador import STOPWORDS_RIESGO
+
+# Parámetros de entrenar_modelov4.py
+PESO_COLORES = 2.5
+PESO_TEXTO = 0.5
+MAX_FEATURES = 80
+ORDEN_RIESGO = {'rojos_topados': 3, 'amarillos_topados': 1}
+TOPE_COLORES = 5
+
+# Muestra para silhouette_score (es O(N²)); con menos estudiantes se usan todos
+MUESTRA_SILUETA = 5000
+
+
+def matriz_colores(rojos, amarillos):
+    """
+    (X_colores, scaler, X_colores_scaled) con las columnas riesgo_score, rojos_topados y
+    amarillos_topados. Mismo clipping que PredictorRiesgo._entradas_colores.
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    X_colores = pd.DataFrame({
+        'rojos_topados': np.minimum(np.asarray(rojos, dtype=int), TOPE_COLORES),
+        'amarillos_topados': np.minimum(np.asarray(amarillos, dtype=int), TOPE_COLORES),
+    })
+    X_colores.insert(0, 'riesgo_score', sum(peso * X_colores[col] for col, peso in ORDEN_RIESGO.items()))
+    scaler = StandardScaler()
+    return X_colores, scaler, scaler.fit_transform(X_colores)
+
+
+def vectorizar_tfidf(documentos, max_features=MAX_FEATURES):
+    """(tfidf, X_texto CSR) de documentos ya normalizados (acepta un generador)."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    tfidf = TfidfVectorizer(
+        max_features=max_features,
+        stop_words=STOPWORDS_RIESGO,
+        ngram_range=(1, 2),
+        min_df=3,  # Filtrar palabras muy raras
+    )
+    return tfidf, tfidf.fit_transform(documentos)
+
+
+def matriz_final(X_colores_scaled, X_texto, peso_colores=PESO_COLORES, peso_texto=PESO_TEXTO):
+    """[colores * peso_colores | texto * peso_texto] en CSR (sin densificar el texto)."""
+    return sparse.hstack([
+        sparse.csr_matrix(X_colores_scaled * peso_colores),
+        sparse.csr_matrix(X_texto) * peso_texto,
+    ]).tocsr()
+
+
+def ajustar_kmeans(X_final, n_clusters, n_init=20, random_state=42):
+    from sklearn.cluster import KMeans
+
+    kmeans = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=n_init, max_iter=500)
+    return kmeans.fit(X_final)
+
+
+def mapa_orden_por_score(riesgo_score, etiquetas_cluster):
+    """{cluster: nivel} ordenando los clusters por riesgo_score promedio (0 = sin riesgo)."""
+    promedios = pd.Series(np.asarray(riesgo_score, dtype=float)).groupby(np.asarray(etiquetas_cluster)).mean()
+    return {int(cluster_id): nivel for nivel, cluster_id in enumerate(promedios.sort_values(kind='stable').index)}
+
+
+def evaluar_config(X_colores_scaled, riesgo_score, X_texto, niveles_hitl, peso_texto, n_clusters,
+                   peso_colores=PESO_COLORES, n_init=20):
+    """
+    Entrena y mide una configuración. `niveles_hitl` tiene el nivel_riesgo_manual de cada fila
+    (-1 sin etiqueta). Retorna un dict con la silueta, el tamaño de cada nivel, el acuerdo con
+    las etiquetas manuales (None si no hay) y el KMeans entrenado.
+    """
+    from sklearn.metrics import silhouette_score
+
+    X_final = matriz_final(X_colores_scaled, X_texto, peso_colores, peso_texto)
+    kmeans = ajustar_kmeans(X_final, n_clusters, n_init=n_init)
+    mapa_orden = mapa_orden_por_score(riesgo_score, kmeans.labels_)
+    niveles = np.array([mapa_orden[c] for c in kmeans.labels_])
+
+    if len(set(kmeans.labels_)) > 1:
+        silueta = float(silhouette_score(
+            X_final, kmeans.labels_, sample_size=min(X_final.shape[0], MUESTRA_SILUETA), random_state=42,
+        ))
+    else:
+        silueta = None
+
+    etiquetados = niveles_hitl >= 0
+    acuerdo = float((niveles[etiquetados] == niveles_hitl[etiquetados]).mean()) if etiquetados.any() else None
+
+    return {
+        'silueta': silueta,
+        'inercia': float(kmeans.inertia_),
+        'tamanos': np.bincount(niveles, minlength=n_clusters).tolist(),
+        'acuerdo_hitl': acuerdo,
+        'etiquetados': int(etiquetados.sum()),
+        'kmeans': kmeans,
+        'mapa_orden': mapa_orden,
+    }
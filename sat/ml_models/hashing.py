@@ -0,0 +1,135 @@
+"""
+Featurización por hashing (alternativa sin vocabulario al TfidfVectorizer)
+=========================================================================
+Cada n-grama va a la columna murmurhash3(n-grama) % n_features, igual que
+sklearn.feature_extraction.text.HashingVectorizer. No hay vocabulario que ajustar
+ni que mantener sincronizado: lo único que se aprende del corpus es el vector idf.
+
+  - Entrenamiento (data_analysis/): contar_por_bloques cuenta el corpus por bloques
+    (en paralelo con joblib) y calcular_idf obtiene el idf desde las frecuencias
+    por documento, con la misma fórmula que TfidfTransformer(smooth_idf=True).
+  - Inferencia (MotorRiesgoNumpy): indice_hash calcula la columna de cada término
+    en Python puro, sin estado compartido: cualquier proceso o shard da el mismo resultado.
+
+Este módulo NO importa Django; scikit-learn/scipy solo se usan en las funciones de entrenamiento.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+N_FEATURES_POR_DEFECTO = 2 ** 10
+TOKEN_PATTERN_POR_DEFECTO = r"(?u)\b\w\w+\b"
+
+
+def _murmurhash3_32(clave, semilla=0):
+    """MurmurHash3 x86 de 32 bits con signo (mismo valor que sklearn.utils.murmurhash3_32)."""
+    datos = clave.encode('utf-8')
+    largo = len(datos)
+    c1, c2 = 0xcc9e2d51, 0x1b873593
+    h = semilla & 0xffffffff
+
+    fin_bloques = largo - (largo % 4)
+    for i in range(0, fin_bloques, 4):
+        k = int.from_bytes(datos[i:i + 4], 'little')
+        k = (k * c1) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        k = (k * c2) & 0xffffffff
+        h ^= k
+        h = ((h << 13) | (h >> 19)) & 0xffffffff
+        h = (h * 5 + 0xe6546b64) & 0xffffffff
+
+    k = 0
+    cola = datos[fin_bloques:]
+    if len(cola) == 3:
+        k ^= cola[2] << 16
+    if len(cola) >= 2:
+        k ^= cola[1] << 8
+    if cola:
+        k ^= cola[0]
+        k = (k * c1) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        k = (k * c2) & 0xffffffff
+        h ^= k
+
+    h ^= largo
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & 0xffffffff
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & 0xffffffff
+    h ^= h >> 16
+    return h - 0x100000000 if h & 0x80000000 else h
+
+
+@lru_cache(maxsize=2 ** 16)
+def indice_hash(termino, n_features, alternate_sign=False):
+    """(columna, signo) del término, con las mismas reglas que FeatureHasher."""
+    h = _murmurhash3_32(termino)
+    if h == -2 ** 31:
+        indice = (2 ** 31 - 1 - (n_features - 1)) % n_features
+    else:
+        indice = abs(h) % n_features
+    signo = -1.0 if alternate_sign and h < 0 else 1.0
+    return indice, signo
+
+
+def parametros_hashing(n_features=N_FEATURES_POR_DEFECTO, stop_words=None, ngram_range=(1, 2),
+                       token_pattern=TOKEN_PATTERN_POR_DEFECTO):
+    """Configuración del vectorizador que se guarda en el artefacto (sección 'tfidf' del .json)."""
+    return {
+        'n_features': int(n_features),
+        'alternate_sign': False,
+        'lowercase': True,
+        'token_pattern': token_pattern,
+        'ngram_range': list(ngram_range),
+        'stop_words': sorted(stop_words or []),
+        'norm': 'l2',
+        'sublinear_tf': False,
+        'binary': False,
+    }
+
+
+def _vectorizador(cfg):
+    from sklearn.feature_extraction.text import HashingVectorizer
+    return HashingVectorizer(
+        n_features=cfg['n_features'],
+        alternate_sign=cfg['alternate_sign'],
+        lowercase=cfg['lowercase'],
+        token_pattern=cfg['token_pattern'],
+        ngram_range=tuple(cfg['ngram_range']),
+        stop_words=cfg['stop_words'] or None,
+        norm=None,  # conteos crudos: el idf y la normalización se aplican después
+    )
+
+
+def _contar_bloque(textos, cfg):
+    return _vectorizador(cfg).transform(textos)
+
+
+def contar_por_bloques(textos, cfg, tamano_bloque=5000, n_jobs=1):
+    """
+    Matriz CSR de conteos (N, n_features) del corpus, procesada por bloques.
+    Como el hashing no tiene estado, los bloques son independientes (n_jobs > 1 los reparte).
+    """
+    from joblib import Parallel, delayed
+    from scipy import sparse
+
+    textos = list(textos)
+    bloques = [textos[i:i + tamano_bloque] for i in range(0, len(textos), tamano_bloque)]
+    partes = Parallel(n_jobs=n_jobs)(delayed(_contar_bloque)(bloque, cfg) for bloque in bloques)
+    return sparse.vstack(partes).tocsr()
+
+
+def calcular_idf(X_conteos):
+    """idf = ln((1 + n) / (1 + df)) + 1, como TfidfTransformer(smooth_idf=True)."""
+    X_conteos = X_conteos.tocsr()
+    X_conteos.sum_duplicates()
+    n_documentos = X_conteos.shape[0]
+    df = np.bincount(X_conteos.indices, minlength=X_conteos.shape[1])
+    return np.log((1 + n_documentos) / (1 + df)) + 1
+
+
+def aplicar_idf(X_conteos, idf):
+    """Conteos → TF-IDF normalizado por fila (l2), en CSR."""
+    from sklearn.preprocessing import normalize
+    return normalize(X_conteos.multiply(idf).tocsr(), norm='l2')
@@ -0,0 +1,76 @@
+"""
+Normalizador de texto compartido (entrenamiento + inferencia)
+=============================================================
+Única implementación de la limpieza que alimenta al TF-IDF. La importan
+sat/services.py y los scripts de data_analysis/, así ambos lados generan
+exactamente las mismas features.
+
+Pasos (en este orden):
+  1. Minúsculas y quitar las etiquetas [rojo]/[amarillo].
+  2. Quitar acentos, ñ y ü (solo se reemplazan los caracteres presentes en el texto).
+  3. Una sola regex precompilada que elimina números y signos.
+
+Nota de rendimiento: str.translate con tabla es ~10x más lento que str.replace en
+CPython para textos no ASCII (los nuestros siempre lo son), y una regex con la
+alternativa de etiquetas es más lenta que los dos str.replace previos.
+
+Este módulo NO importa Django.
+"""
+
+import re
+
+import pandas as pd
+
+_ACENTOS = (
+    ('á', 'a'), ('é', 'e'), ('í', 'i'), ('ó', 'o'), ('ú', 'u'),
+    ('à', 'a'), ('è', 'e'), ('ì', 'i'), ('ò', 'o'), ('ù', 'u'),
+    ('ü', 'u'), ('ñ', 'n'),
+)
+
+_RE_LIMPIEZA = re.compile(r'[^\w\s]|\d')
+
+
+def normalizar_texto(texto):
+    """Normaliza un texto. Cualquier valor que no sea str (None, NaN) se convierte en ""."""
+    if not isinstance(texto, str):
+        return ""
+    txt = texto.lower()
+    if '[' in txt:
+        # Antes de la regex: si no, los corchetes se borran y quedaría "rojo" como palabra
+        txt = txt.replace('[rojo]', '').replace('[amarillo]', '')
+    for acento, base in _ACENTOS:
+        if acento in txt:
+            txt = txt.replace(acento, base)
+    return _RE_LIMPIEZA.sub('', txt)
+
+
+def normalizar_lote(textos):
+    """
+    Versión por lote de normalizar_texto.
+    Recibe una pd.Series (retorna una Series con el mismo índice) o cualquier iterable (retorna una lista).
+    """
+    if isinstance(textos, pd.Series):
+        return pd.Series([normalizar_texto(t) for t in textos], index=textos.index, dtype=object)
+    return [normalizar_texto(t) for t in textos]
+
+
+# Palabras que NO aportan para detectar riesgo (lista negra del TF-IDF de entrenar_modelov4.py
+# y de manage.py entrenar_modelo)
+_STOPWORDS = [
+    # Conectores
+    'el', 'la', 'de', 'en', 'y', 'a', 'que', 'los', 'se', 'un', 'del', 'con', 'no', 'si', 'por', 'lo', 'su', 'para', 'al', 'es', 'son', 'como', 'pero', 'mas', 'esta', 'este', 'fue', 'ha', 'le',
+    # Contexto irrelevante
+    'estudiante', 'alumno', 'alumna', 'tutorado', 'tutor', 'tutoria', 'carrera', 'universidad', 'año', 'semestre',
+    # Datos Socioeconómicos/Perfil (que se repiten mucho y ensucian)
+    'gratuidad', 'beca', 'fondo', 'solidario', 'cae', 'residencia', 'procedencia', 'beneficio', 'arancel',
+    # Familia (Información de contexto, no alerta)
+    'mama', 'papa', 'madre', 'padre', 'hermano', 'hermana', 'abuela', 'abuelo', 'tio', 'tia', 'vive', 'familia', 'hogar',
+    # Rellenos comunes
+    'bien', 'mal', 'regular', 'contacto', 'correo', 'telefono', 'whatsapp', 'celular', 'responde', 'contesta',
+    # Administrativo (Fechas, trámites, etc.)
+    'llega', 'espera', 'fecha', 'interinstitucional', 'traslado', 'dice', 'va', 'tiene', 'esta',
+    # Palabras genéricas encontradas
+    'primera', 'ninguna', 'opcion', 'taller', 'casa', 'poco', 'depues', 'fundamentos'
+]
+# Mismo normalizador que los textos, si no 'año' nunca coincidiría con el token 'ano'
+STOPWORDS_RIESGO = sorted(set(normalizar_lote(_STOPWORDS)))
@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -86,8 +88,19 @@ class Bitacora(models.Model):
     # 3. Año académico (útil para filtrar bitácoras por año)
     anio_academico = models.IntegerField(default=2025)
 
+    # 4. Hora del servidor del último alta/edición (fecha_registro la ingresa el usuario y puede
+    # ser de cualquier día): con esta se detectan los datos nuevos para el aprendizaje online
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+
     class Meta:
         db_table = 'bitacora'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Estudiante en la BD: si la bitácora se reasigna, la señal invalida también al anterior
+        instancia._estudiante_id_bd = instancia.__dict__.get('estudiante_id')
+        return instancia
     
     def save(self, *args, **kwargs):
         # La IA y el clustering ahora dependen puramente del TF-IDF de los textos 
@@ -226,6 +239,25 @@ class Estudiante(models.Model):
         default=False,
         help_text="Si True, la IA cambió el riesgo recientemente y el EC debe confirmar o corregir"
     )
+
+    # Calculados junto con nivel_riesgo_ia a partir de las distancias a los centroides
+    confianza_ia = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Margen entre el centroide más cercano y el segundo (0 = frontera, 1 = asignación clara)"
+    )
+
+    nivel_riesgo_ia_alternativo = models.IntegerField(
+        null=True,
+        blank=True,
+        help_text="Nivel del segundo centroide más cercano (a qué nivel estuvo cerca de caer)"
+    )
+
+    terminos_ia = models.JSONField(
+        null=True,
+        blank=True,
+        help_text='N-gramas que más acercaron al estudiante a su cluster: [["termino", aporte], ...]'
+    )
     
     def get_nivel_riesgo_efectivo(self):
         """
@@ -245,6 +277,49 @@ class Estudiante(models.Model):
         """Retorna True si la última actualización fue del EC"""
         return self.riesgo_sobrescrito
 
+    # --- Valores en la BD de los campos que compara la señal registrar_historial_riesgo ---
+    # Se recuerdan al cargar (from_db), al guardar y al refrescar, así la señal no vuelve a
+    # consultar la fila en cada save().
+    CAMPOS_HISTORIAL_RIESGO = (
+        'nivel_riesgo_ia', 'nivel_riesgo_manual', 'riesgo_sobrescrito', 'riesgo_pendiente_validacion',
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Con only()/defer() solo se conocen los campos cargados
+        instancia._valores_bd = {
+            campo: valor for campo, valor in zip(field_names, values) if campo in cls.CAMPOS_HISTORIAL_RIESGO
+        }
+        return instancia
+
+    def _recordar_valores_bd(self, campos=None):
+        """Toma los valores actuales de `campos` (todos los de CAMPOS_HISTORIAL_RIESGO si es None) como los de la BD."""
+        diferidos = self.get_deferred_fields()
+        valores = self.__dict__.setdefault('_valores_bd', {})
+        for campo in self.CAMPOS_HISTORIAL_RIESGO:
+            if (campos is None or campo in campos) and campo not in diferidos:
+                valores[campo] = getattr(self, campo)
+
+    def valores_bd(self):
+        """
+        {campo: valor} de CAMPOS_HISTORIAL_RIESGO tal como están en la BD, o None si no se
+        conocen todos (instancia no cargada desde la BD o cargada con only()/defer()).
+        """
+        valores = getattr(self, '_valores_bd', None)
+        if valores is None or len(valores) < len(self.CAMPOS_HISTORIAL_RIESGO):
+            return None
+        return valores
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._recordar_valores_bd(None if update_fields is None else set(update_fields))
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._recordar_valores_bd(None if fields is None else set(fields))
+
     class Meta:
         db_table = 'estudiante'
 
@@ -477,10 +552,268 @@ class ComentarioBitacora(models.Model):
     texto = models.TextField()
     autor = models.ForeignKey('Usuario', on_delete=models.SET_NULL, null=True)
     fecha_creacion = models.DateTimeField(default=timezone.now)
+    # Hora del servidor del último alta/edición (ver Bitacora.fecha_modificacion)
+    fecha_modificacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'comentario_bitacora'
         ordering = ['fecha_creacion']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Bitácora en la BD: si el comentario se mueve, la señal invalida también al estudiante anterior
+        instancia._bitacora_id_bd = instancia.__dict__.get('bitacora_id')
+        return instancia
+
+    def __str__(self):
+        return f"Comentario de {self.autor} en bitácora {self.bitacora_id}"
+
+class FeatureEstudiante(models.Model):
+    """
+    Feature store del modelo IA: features ya calculadas de cada estudiante
+    (conteos de rojos/amarillos + vector TF-IDF disperso), selladas con la versión
+    de la featurización que las generó (vocabulario + idf + configuración del TF-IDF;
+    mover los centroides no las invalida). Las señales de Bitacora/ComentarioBitacora borran
+    la fila del estudiante cuando cambian sus textos, así el batch solo vuelve a
+    vectorizar a quienes tuvieron actividad.
+    """
+    estudiante = models.OneToOneField(
+        'Estudiante',
+        models.CASCADE,  # Si el estudiante se borra, sus features ya no sirven
+        primary_key=True,
+        db_column='id_estudiante',
+        related_name='features_ia'
+    )
+    version_featurizacion = models.CharField(
+        max_length=64,
+        help_text="Versión de la featurización con que se vectorizó (si no coincide, se recalcula)"
+    )
+    cant_bitacoras = models.IntegerField(default=0)
+    cant_rojos = models.IntegerField(default=0)
+    cant_amarillos = models.IntegerField(default=0)
+    vector_tfidf = models.JSONField(
+        default=dict,
+        help_text='Fila TF-IDF dispersa: {"indices": [...], "valores": [...]}'
+    )
+    fecha_calculo = models.DateTimeField(
+        default=timezone.now,
+        help_text="Instante en que se leyeron los textos (se descarta si hay una marca de recálculo posterior)"
+    )
+
+    class Meta:
+        db_table = 'feature_estudiante'
+        verbose_name = 'Features IA de estudiante'
+        verbose_name_plural = 'Features IA de estudiantes'
+
+    def __str__(self):
+        return f"Features de {self.estudiante_id} (featurización {self.version_featurizacion})"
+
+
+class MarcaRecalculo(models.Model):
+    """
+    Dirty-set del batch nocturno: estudiantes cuya información cambió (bitácoras,
+    comentarios o alta nueva) desde el último recálculo. La llenan las señales y la
+    vacía `recalcular_riesgos_batch --incremental` al procesar cada estudiante.
+    """
+    estudiante = models.OneToOneField(
+        'Estudiante',
+        models.CASCADE,
+        primary_key=True,
+        db_column='id_estudiante',
+        related_name='marca_recalculo'
+    )
+    fecha_marca = models.DateTimeField(
+        default=timezone.now,
+        help_text="Último cambio detectado (se borra solo si el batch empezó después de esta fecha)"
+    )
+
+    class Meta:
+        db_table = 'marca_recalculo'
+        verbose_name = 'Marca de recálculo'
+        verbose_name_plural = 'Marcas de recálculo'
+
+    def __str__(self):
+        return f"Recalcular {self.estudiante_id} (desde {self.fecha_marca:%Y-%m-%d %H:%M})"
+
+    @classmethod
+    def marcar(cls, estudiante_id):
+        """Marca (o re-marca con la hora actual) a un estudiante como pendiente de recálculo."""
+        ahora = timezone.now()
+        if not cls.objects.filter(estudiante_id=estudiante_id).update(fecha_marca=ahora):
+            cls.objects.bulk_create([cls(estudiante_id=estudiante_id, fecha_marca=ahora)], ignore_conflicts=True)
+
+
+class TrabajoRecalculo(models.Model):
+    """
+    Cola de recálculos masivos de riesgo IA. La vista recalcular_riesgo_masivo solo
+    encola una fila; el comando `procesar_trabajos_recalculo` (proceso aparte) la toma,
+    la ejecuta y va actualizando el progreso que consulta el dashboard.
+
+    Mientras corre, el worker renueva fecha_latido con cada avance. Un trabajo en 'EJ'
+    sin latido por más de VENCIMIENTO_LATIDO es de un worker que murió: liberar_vencidos
+    lo devuelve a la cola (o lo da por fallido tras MAX_INTENTOS).
+    """
+    VENCIMIENTO_LATIDO = timedelta(minutes=5)
+    MAX_INTENTOS = 3
+
+    ESTADO_CHOICES = [
+        ('PE', 'Pendiente'),
+        ('EJ', 'En ejecución'),
+        ('OK', 'Completado'),
+        ('ER', 'Error'),
+    ]
+
+    carrera = models.ForeignKey(
+        'Carrera',
+        models.CASCADE,  # Si la carrera se borra, el trabajo ya no tiene sentido (y no debe pasar a "todos")
+        null=True,
+        blank=True,
+        db_column='id_carrera',
+        help_text="Carrera a recalcular (vacío = todos los estudiantes)"
+    )
+    solicitado_por = models.ForeignKey(
+        'Usuario',
+        models.SET_NULL,
+        null=True,
+        blank=True,
+        db_column='id_usuario',
+        related_name='trabajos_recalculo'
+    )
+    estado = models.CharField(max_length=2, choices=ESTADO_CHOICES, default='PE')
+    total = models.IntegerField(default=0)
+    procesados = models.IntegerField(default=0)
+    actualizados = models.IntegerField(default=0)
+    sin_cambio = models.IntegerField(default=0)
+    errores = models.IntegerField(default=0)
+    detalle_error = models.TextField(blank=True, default='')
+    intentos = models.IntegerField(default=0, help_text="Veces que un worker tomó el trabajo")
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_latido = models.DateTimeField(null=True, blank=True, help_text="Último avance informado por el worker")
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'trabajo_recalculo'
+        ordering = ['-fecha_creacion']
+        verbose_name = 'Trabajo de recálculo'
+        verbose_name_plural = 'Trabajos de recálculo'
+
+    def __str__(self):
+        alcance = self.carrera or 'todos los estudiantes'
+        return f"Recálculo #{self.pk} de {alcance} ({self.get_estado_display()})"
+
+    @property
+    def terminado(self):
+        return self.estado in ('OK', 'ER')
+
+    def resumen(self):
+        """Texto del resumen final (el mismo que mostraba la vista con el recálculo síncrono)."""
+        if self.estado == 'ER':
+            return f'❌ Error en el recálculo masivo: {self.detalle_error}'
+
+        alcance = self.carrera.nombre if self.carrera_id else 'todos los estudiantes'
+        msg = (
+            f'🤖 Recálculo completado para {alcance}: '
+            f'{self.procesados} estudiantes procesados — '
+            f'{self.actualizados} actualizados, {self.sin_cambio} sin cambio'
+        )
+        if self.errores:
+            msg += f', {self.errores} con error'
+        if self.actualizados > 0:
+            msg += f'. ⏳ {self.actualizados} estudiante(s) pendiente(s) de confirmación.'
+        return msg
+
+    @classmethod
+    def tomar_siguiente(cls):
+        """
+        Toma el trabajo pendiente más antiguo y lo pasa a 'EJ'. El UPDATE condicionado
+        al estado evita que dos workers tomen el mismo trabajo. None si no hay pendientes.
+        Antes recupera los trabajos de workers muertos (liberar_vencidos).
+        """
+        cls.liberar_vencidos()
+        for trabajo_id in cls.objects.filter(estado='PE').order_by('fecha_creacion').values_list('pk', flat=True)[:5]:
+            ahora = timezone.now()
+            if cls.objects.filter(pk=trabajo_id, estado='PE').update(
+                estado='EJ', fecha_inicio=ahora, fecha_latido=ahora, intentos=models.F('intentos') + 1
+            ):
+                return cls.objects.get(pk=trabajo_id)
+        return None
+
+    @classmethod
+    def liberar_vencidos(cls):
+        """
+        Trabajos en 'EJ' sin latido desde hace más de VENCIMIENTO_LATIDO: vuelven a 'PE' con el
+        avance en cero (el recálculo es idempotente) o pasan a 'ER' si ya agotaron los intentos.
+        """
+        limite = timezone.now() - cls.VENCIMIENTO_LATIDO
+        vencidos = cls.objects.filter(
+            # Sin latido: trabajos tomados antes de que existiera el campo
+            models.Q(fecha_latido__lt=limite) | models.Q(fecha_latido__isnull=True, fecha_inicio__lt=limite),
+            estado='EJ',
+        )
+        vencidos.filter(intentos__gte=cls.MAX_INTENTOS).update(
+            estado='ER', fecha_fin=timezone.now(),
+            detalle_error=f'El worker se detuvo durante el recálculo ({cls.MAX_INTENTOS} intentos).',
+        )
+        vencidos.filter(intentos__lt=cls.MAX_INTENTOS).update(
+            estado='PE', procesados=0, actualizados=0, sin_cambio=0, errores=0,
+        )
+
+    def registrar_avance(self):
+        """Guarda los contadores y renueva el latido (el trabajo sigue vivo)."""
+        self.fecha_latido = timezone.now()
+        self.save(update_fields=['total', 'procesados', 'actualizados', 'sin_cambio', 'errores', 'fecha_latido'])
+
+
+class EjecucionBatch(models.Model):
+    """
+    Checkpoint de `recalcular_riesgos_batch`: cada bloque de ids se confirma en su propia
+    transacción y acá queda el último id completado (todos los menores ya están listos).
+    Si la corrida se corta, `--resume` sigue desde ultimo_id con la misma fecha_inicio.
+    """
+    MODO_CHOICES = [
+        ('FU', 'Completo'),
+        ('IN', 'Incremental'),
+    ]
+    ESTADO_CHOICES = [
+        ('EJ', 'En ejecución'),
+        ('OK', 'Completada'),
+        ('IT', 'Interrumpida'),
+    ]
+
+    modo = models.CharField(max_length=2, choices=MODO_CHOICES)
+    estado = models.CharField(max_length=2, choices=ESTADO_CHOICES, default='EJ')
+    ultimo_id = models.IntegerField(
+        default=0,
+        help_text="Último id de estudiante completado (los bloques se procesan en orden de id)"
+    )
+    total = models.IntegerField(default=0)
+    procesados = models.IntegerField(default=0)
+    actualizados = models.IntegerField(default=0)
+    sin_cambio = models.IntegerField(default=0)
+    errores = models.IntegerField(default=0)
+    fecha_inicio = models.DateTimeField(
+        default=timezone.now,
+        help_text="Inicio de la corrida original (las marcas posteriores quedan para la próxima)"
+    )
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'ejecucion_batch'
+        ordering = ['-fecha_inicio']
+        verbose_name = 'Ejecución del batch'
+        verbose_name_plural = 'Ejecuciones del batch'
+
     def __str__(self):
-        return f"Comentario de {self.autor} en bitácora {self.bitacora_id}"
\ No newline at end of file
+        return (
+            f"Batch {self.get_modo_display().lower()} del {self.fecha_inicio:%Y-%m-%d %H:%M} "
+            f"({self.get_estado_display()}, hasta id {self.ultimo_id})"
+        )
+
+    @classmethod
+    def pendiente(cls, modo):
+        """La corrida más reciente del modo si quedó sin terminar; None si terminó o no hay."""
+        ultima = cls.objects.filter(modo=modo).order_by('-fecha_inicio').first()
+        return ultima if ultima is not None and ultima.estado != 'OK' else None
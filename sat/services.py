@@ -1,23 +1,260 @@
+import hashlib
 import joblib
 import os
+import threading
+import time
 import numpy as np
 import re
 import pandas as pd
 from django.conf import settings
-from .models import Estudiante, Bitacora
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .models import Estudiante, Bitacora, FeatureEstudiante, HistorialRiesgo
+from .ml_models.artefacto import base_artefacto, leer_artefacto, version_featurizacion
+from .ml_models.hashing import indice_hash
+from .ml_models.normalizador import normalizar_texto, normalizar_lote
+from .signals import notificar_predicciones_pendientes_lote
+
+# Peso del bloque de texto en la matriz final (Debe ser idéntico al entrenamiento: colores x 1.0, texto x 1.5)
+PESO_TEXTO = 1.5
+
+# Cantidad de estudiantes que se vectorizan juntos en predecir_lote (acota la memoria del batch)
+TAMANO_BLOQUE = 1000
+
+# Ruta dinámica y a prueba de balas (sin hardcodear el nombre de la carpeta del proyecto)
+RUTA_MODELO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml_models', 'modelo_sat.pkl')
+
+# Artefacto compacto (.npz + .json, sin sklearn). Si existe, tiene prioridad sobre el .pkl
+RUTA_ARTEFACTO = base_artefacto(RUTA_MODELO)
+
+# Arreglos del artefacto extraídos a .npy para mapearlos en memoria (compartidos entre workers)
+RUTA_MMAP = os.path.join(os.path.dirname(RUTA_MODELO), 'cache', 'mmap')
+
+# Campos que iterar_predicciones deja calculados en cada Estudiante (junto con el nivel)
+CAMPOS_DETALLE_IA = ['confianza_ia', 'nivel_riesgo_ia_alternativo', 'terminos_ia']
+
+# Cantidad de n-gramas que se guardan como explicación de la predicción (Estudiante.terminos_ia)
+N_TERMINOS_EXPLICACION = 5
+
+# Coalescedor de recálculos individuales: ventana de espera (segundos) y tamaño que la corta antes
+VENTANA_COALESCEDOR = 0.005
+LOTE_MAX_COALESCEDOR = 64
+
+# Registro del predictor compartido por el proceso: (predictor, firma del .pkl). Ver obtener_predictor
+_registro_predictor = (None, None)
+_registro_lock = threading.Lock()
+
+
+class MotorRiesgoNumpy:
+    """
+    Motor de inferencia que solo usa NumPy, construido desde el artefacto compacto
+    (ver sat/ml_models/artefacto.py). Replica TfidfVectorizer.transform, StandardScaler
+    y KMeans.predict sin importar scikit-learn/scipy ni deserializar pickles.
+    """
+
+    def __init__(self, ruta_base, directorio_mmap=None):
+        # directorio_mmap: los arreglos quedan mapeados en memoria (ver leer_artefacto)
+        arreglos, meta = leer_artefacto(ruta_base, directorio_mmap=directorio_mmap)
+        self.centroides = arreglos['centroides']
+        self.scaler_media = arreglos['scaler_media']
+        self.scaler_escala = arreglos['scaler_escala']
+        self.idf = arreglos['idf']
+        self.pesos = arreglos['pesos']
+
+        self.version = meta['version_modelo']
+        # Artefactos anteriores no la traen en el .json: se calcula igual que guardar_artefacto
+        self.version_featurizacion = meta.get('version_featurizacion') or version_featurizacion(self.idf, meta)
+        self.columnas = meta['columnas_numericas']
+        self.mapa_orden = {int(k): v for k, v in meta['mapa_orden'].items()}
+        # 'tfidf' (vocabulario ajustado) o 'hashing' (columna = hash del término, sin vocabulario)
+        self.featurizacion = meta.get('featurizacion', 'tfidf')
+        self.vocabulario = meta['vocabulario']
+
+        cfg = meta['tfidf']
+        self._alternate_sign = cfg.get('alternate_sign', False)
+        self._lowercase = cfg['lowercase']
+        self._token_re = re.compile(cfg['token_pattern'])
+        self._ngram_min, self._ngram_max = cfg['ngram_range']
+        # Las stop words pasan por el mismo normalizador que los textos (p. ej. 'año' → 'ano')
+        self._stop_words = frozenset(normalizar_lote(cfg['stop_words']))
+        self._norm = cfg['norm']
+        self._sublinear_tf = cfg['sublinear_tf']
+        self._binary = cfg['binary']
+
+    def _analizar(self, documento):
+        """Tokens + n-gramas, en el mismo orden y con las mismas reglas que TfidfVectorizer."""
+        if self._lowercase:
+            documento = documento.lower()
+        tokens = [t for t in self._token_re.findall(documento) if t not in self._stop_words]
+
+        terminos = list(tokens) if self._ngram_min == 1 else []
+        for n in range(max(self._ngram_min, 2), min(self._ngram_max, len(tokens)) + 1):
+            terminos.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terminos
+
+    def transformar_texto(self, obs_limpias):
+        """Matriz TF-IDF densa (N, vocab) normalizada por fila."""
+        X = np.zeros((len(obs_limpias), len(self.idf)), dtype=np.float64)
+        if self.featurizacion == 'hashing':
+            n_features, alternate_sign = len(self.idf), self._alternate_sign
+            for fila, documento in enumerate(obs_limpias):
+                for termino in self._analizar(documento):
+                    idx, signo = indice_hash(termino, n_features, alternate_sign)
+                    X[fila, idx] += signo
+        else:
+            vocabulario = self.vocabulario
+            for fila, documento in enumerate(obs_limpias):
+                for termino in self._analizar(documento):
+                    idx = vocabulario.get(termino)
+                    if idx is not None:
+                        X[fila, idx] += 1
+
+        if self._binary:
+            X = (X > 0).astype(np.float64)
+        if self._sublinear_tf:
+            positivos = X > 0
+            X[positivos] = np.log(X[positivos]) + 1
+        X *= self.idf
+
+        if self._norm == 'l2':
+            normas = np.sqrt((X ** 2).sum(axis=1))
+        elif self._norm == 'l1':
+            normas = np.abs(X).sum(axis=1)
+        else:
+            return X
+        normas[normas == 0] = 1
+        return X / normas[:, None]
+
+    def matriz_numerica(self, rojos_input, amarillos_input):
+        """Columnas numéricas escaladas, en el orden registrado en el artefacto."""
+        disponibles = {
+            'rojos_topados': rojos_input,
+            'amarillos_topados': amarillos_input,
+            'riesgo_score': rojos_input * 3 + amarillos_input,
+        }
+        X = np.column_stack([disponibles[c] for c in self.columnas]).astype(np.float64)
+        return (X - self.scaler_media) / self.scaler_escala
+
+    def matriz_final(self, X_num, X_texto):
+        """[X_num | X_texto] * pesos: el espacio en que viven los centroides."""
+        return np.concatenate([X_num, X_texto], axis=1) * self.pesos
+
+    def distancias(self, X_num, X_texto):
+        """Distancia al cuadrado (N, k) de [X_num | X_texto] * pesos a cada centroide."""
+        X_final = self.matriz_final(X_num, X_texto)
+        producto = X_final @ self.centroides.T
+        norma_x = (X_final ** 2).sum(axis=1)
+        norma_c = (self.centroides ** 2).sum(axis=1)
+        return np.maximum(norma_x[:, None] - 2 * producto + norma_c[None, :], 0)
+
+    def predecir_clusters(self, rojos_input, amarillos_input, obs_limpias):
+        X_num = self.matriz_numerica(rojos_input, amarillos_input)
+        X_texto = self.transformar_texto(obs_limpias)
+        return self.distancias(X_num, X_texto).argmin(axis=1)
+
+
+def conteos_bitacoras(bitacoras_qs):
+    """{id_estudiante: (total, rojos, amarillos)} de las bitácoras dadas, en una sola consulta agregada."""
+    return {
+        fila['estudiante_id']: (fila['total'], fila['rojos'], fila['amarillos'])
+        for fila in bitacoras_qs.values('estudiante_id').annotate(
+            total=Count('pk'),
+            rojos=Count('pk', filter=Q(estado_atencion=3)),
+            amarillos=Count('pk', filter=Q(estado_atencion=2)),
+        ).order_by()
+    }
+
+
+def iterar_textos_estudiantes(bitacoras_qs, chunk_size=2000):
+    """
+    Genera (id_estudiante, [textos]) en orden de id: la observación de cada bitácora seguida de
+    sus comentarios. Una sola consulta leída con cursor del lado del servidor (iterator), así
+    solo hay en memoria los textos de un estudiante a la vez.
+    """
+    filas = bitacoras_qs.order_by(
+        'estudiante_id', 'id_bitacora', 'comentarios__fecha_creacion', 'comentarios__id_comentario'
+    ).values_list('estudiante_id', 'id_bitacora', 'observacion', 'comentarios__texto')
+
+    actual, textos, ultima_bitacora = None, [], None
+    for estudiante_id, bitacora_id, observacion, comentario in filas.iterator(chunk_size=chunk_size):
+        if estudiante_id != actual:
+            if actual is not None:
+                yield actual, textos
+            actual, textos = estudiante_id, []
+        if bitacora_id != ultima_bitacora:
+            ultima_bitacora = bitacora_id
+            if observacion: textos.append(observacion)
+        if comentario: textos.append(comentario)
+    if actual is not None:
+        yield actual, textos
+
 
 class PredictorRiesgo:
-    def __init__(self):
-        # Ruta dinámica y a prueba de balas (sin hardcodear el nombre de la carpeta del proyecto)
-        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.model_path = os.path.join(project_root, 'sat', 'ml_models', 'modelo_sat.pkl')
+    def __init__(self, model_path=RUTA_MODELO, disperso=True, usar_feature_store=True, directorio_mmap=None,
+                 guardar_features=True, formato=None):
+        self.model_path = model_path
+        # formato: None → el artefacto junto a model_path si existe, si no el .pkl. Un artefacto
+        # que existe pero no se puede leer es un error: no se cae al .pkl, que entrenar_modelo
+        # ya no reescribe y puede ser de un entrenamiento anterior.
+        # 'artefacto' o 'pkl' → solo ese formato, sin caer al otro (--shadow)
+        self.formato = formato
+        # directorio_mmap: arreglos del artefacto mapeados en memoria y compartidos entre procesos
+        self.directorio_mmap = directorio_mmap
+        # disperso=True: inferencia sin toarray()/np.concatenate (matriz TF-IDF en CSR)
+        self.disperso = disperso
+        # usar_feature_store=False: siempre vectoriza desde la BD y no escribe en feature_estudiante
+        self.usar_feature_store = usar_feature_store
+        # guardar_features=False: lee el feature store pero no escribe en él (--dry-run)
+        self.guardar_features = guardar_features
         self.cerebro = None
+        # Motor NumPy (artefacto .npz/.json). None → se usa el .pkl de scikit-learn
+        self.motor = None
+        # Versión del modelo (hash del artefacto o del .pkl): historial y reportes de shadow
+        self.version_modelo = None
+        # Sello de las features guardadas: solo cambia si cambia la featurización (vocabulario,
+        # idf, configuración del TF-IDF), no al mover centroides. Con el .pkl, su hash
+        self.version_featurizacion = None
+        # índice TF-IDF → n-grama (se arma la primera vez que se necesita, ver _terminos_principales)
+        self._terminos = None
         self.cargar_modelo()
 
     def cargar_modelo(self):
+        ruta_base = base_artefacto(self.model_path)
+        try:
+            if self.formato != 'pkl' and os.path.exists(ruta_base + '.npz') and os.path.exists(ruta_base + '.json'):
+                try:
+                    self.motor = MotorRiesgoNumpy(ruta_base, self.directorio_mmap)
+                except OSError as e:
+                    if self.directorio_mmap is None:
+                        raise
+                    # Sin permiso de escritura para los .npy: cada proceso con su propia copia
+                    print(f"⚠️ No se pudo mapear el artefacto en {self.directorio_mmap} ({e}); se carga en memoria.")
+                    self.motor = MotorRiesgoNumpy(ruta_base)
+                self.cerebro = {'mapa_orden': self.motor.mapa_orden, 'version_modelo': self.motor.version}
+                self.version_modelo = self.motor.version
+                self.version_featurizacion = self.motor.version_featurizacion
+                print(f"🧠 Modelo IA cargado exitosamente (artefacto {self.motor.version}).")
+                return
+        except Exception as e:
+            # Sin modelo (cerebro=None): el batch y las vistas lo reportan como error
+            print(f"❌ Error cargando el artefacto {ruta_base}: {e}")
+            return
+
+        if self.formato == 'artefacto':
+            print(f"⚠️ ADVERTENCIA: No se encontró el artefacto {ruta_base}.npz/.json")
+            return
         try:
             if os.path.exists(self.model_path):
-                self.cerebro = joblib.load(self.model_path)
+                cerebro = joblib.load(self.model_path)
+                if 'tfidf' not in cerebro:
+                    # Modelos con featurizacion='hashing' solo se sirven desde el artefacto compacto
+                    print(f"❌ El .pkl ({cerebro.get('featurizacion')}) requiere el artefacto compacto .npz/.json.")
+                    return
+                self.cerebro = cerebro
+                with open(self.model_path, 'rb') as f:
+                    self.version_modelo = 'pkl-' + hashlib.sha256(f.read()).hexdigest()[:12]
+                self.version_featurizacion = self.version_modelo
                 print("🧠 Modelo IA cargado exitosamente.")
             else:
                 print(f"⚠️ ADVERTENCIA: No se encontró el modelo en {self.model_path}")
@@ -25,63 +262,610 @@ class PredictorRiesgo:
             print(f"❌ Error cargando modelo IA: {e}")
 
     def limpiar_texto(self, texto):
-        if not isinstance(texto, str): return ""
-        txt = str(texto).lower()
-        txt = txt.replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u')
-        txt = re.sub(r'\d+', '', txt)
-        txt = re.sub(r'[^\w\s]', '', txt)
-        return txt
+        # Mismo normalizador que el entrenamiento (sat/ml_models/normalizador.py)
+        return normalizar_texto(texto)
+
+    def _vectorizar_texto(self, textos, normalizados=False):
+        """
+        Matriz TF-IDF (sin ponderar) de N textos crudos (o ya pasados por normalizar_lote si
+        normalizados=True): ndarray denso con el motor NumPy o con disperso=False, CSR con el
+        camino disperso de scikit-learn.
+        """
+        obs_limpias = textos if normalizados else normalizar_lote(textos)
+        if self.motor is not None:
+            return self.motor.transformar_texto(obs_limpias)
+        X_texto = self.cerebro['tfidf'].transform(obs_limpias)
+        return X_texto.tocsr() if self.disperso else X_texto.toarray()
+
+    def _n_vocabulario(self):
+        if self.motor is not None:
+            return len(self.motor.idf)
+        return len(self.cerebro['tfidf'].vocabulary_)
+
+    def _bloque_texto_centroides(self):
+        """(centroides restringidos a las columnas TF-IDF, peso del texto), para el motor o el .pkl."""
+        if self.motor is not None:
+            n_num = len(self.motor.columnas)
+            return self.motor.centroides[:, n_num:], self.motor.pesos[n_num]
+        centroides = self.cerebro['model'].cluster_centers_
+        return centroides[:, centroides.shape[1] - self._n_vocabulario():], PESO_TEXTO
+
+    def _terminos_vocabulario(self):
+        if self._terminos is None:
+            vocabulario = self.motor.vocabulario if self.motor is not None else self.cerebro['tfidf'].vocabulary_
+            terminos = np.empty(len(vocabulario), dtype=object)
+            for termino, idx in vocabulario.items():
+                terminos[idx] = termino
+            self._terminos = terminos
+        return self._terminos
+
+    def _clusters(self, cant_rojos, cant_amarillos, X_texto):
+        """Cluster (sin mapear) de cada fila a partir de los conteos y la matriz de _vectorizar_texto."""
+        return self._distancias(cant_rojos, cant_amarillos, X_texto).argmin(axis=1)
+
+    @staticmethod
+    def _entradas_colores(cant_rojos, cant_amarillos):
+        # CLIPPING
+        rojos_input = np.minimum(np.asarray(cant_rojos, dtype=int), 5)
+        amarillos_input = np.minimum(np.asarray(cant_amarillos, dtype=int), 5)
+        return rojos_input, amarillos_input
+
+    def _distancias(self, cant_rojos, cant_amarillos, X_texto):
+        """Distancia al cuadrado (N, k) de cada fila a cada centroide, en una sola pasada por lote."""
+        rojos_input, amarillos_input = self._entradas_colores(cant_rojos, cant_amarillos)
+
+        if self.motor is not None:
+            X_num = self.motor.matriz_numerica(rojos_input, amarillos_input)
+            return self.motor.distancias(X_num, X_texto)
+
+        if self.disperso:
+            # Escalar numéricos (EL ORDEN EXACTO EXIGIDO POR LA IA: rojos, amarillos)
+            scaler = self.cerebro['scaler']
+            X_colores = np.column_stack([rojos_input, amarillos_input]).astype(np.float64)
+            X_colores = (X_colores - scaler.mean_) / scaler.scale_
+            # Distancias directamente contra model.cluster_centers_
+            return self._distancias_centroides(X_colores, X_texto)
+
+        # 1. Escalar numéricos (EL ORDEN EXACTO EXIGIDO POR LA IA)
+        X_colores_df = pd.DataFrame({
+            'rojos_topados': rojos_input,
+            'amarillos_topados': amarillos_input,
+        })
+        X_colores = self.cerebro['scaler'].transform(X_colores_df)
+
+        # 2. Concatenar (Debe ser idéntico al entrenamiento: colores x 1.0, texto x 1.5)
+        X_final = np.concatenate([X_colores, X_texto * PESO_TEXTO], axis=1)
+
+        # 3. Distancias (KMeans.transform es euclidiana; su argmin es model.predict)
+        return self.cerebro['model'].transform(X_final) ** 2
+
+    def _niveles(self, clusters):
+        mapa_orden = self.cerebro['mapa_orden']
+        return [mapa_orden[int(cluster_id)] for cluster_id in clusters]
+
+    def _detalle(self, distancias, filas):
+        """
+        (nivel, confianza, nivel_alternativo, terminos) de cada fila de la matriz de distancias (N, k).
+        `filas` son las filas TF-IDF dispersas (indices, valores) en el mismo orden.
+
+        Con d1 y d2 las distancias al centroide más cercano y al segundo:
+            confianza = (d2 - d1) / (d2 + d1)
+        0 = justo en la frontera entre dos clusters, 1 = encima del centroide.
+        El nivel alternativo es el del segundo centroide.
+        """
+        # 'stable' → ante empates el primero coincide con argmin (y con model.predict)
+        orden = np.argsort(distancias, axis=1, kind='stable')[:, :2]
+        d = np.sqrt(np.take_along_axis(distancias, orden, axis=1))
+        suma = d.sum(axis=1)
+        confianza = np.divide(d[:, 1] - d[:, 0], suma, out=np.zeros(len(d)), where=suma > 0)
+        return list(zip(
+            self._niveles(orden[:, 0]),
+            np.round(confianza, 4).tolist(),
+            self._niveles(orden[:, 1]),
+            self._terminos_principales(filas, orden[:, 0]),
+        ))
+
+    def _terminos_principales(self, filas, clusters, n=N_TERMINOS_EXPLICACION):
+        """
+        Los `n` n-gramas que más acercan a cada estudiante al centroide que le tocó:
+        aporte = tfidf * peso_texto * centroide[término] (su parte del producto x·c).
+
+        Se calcula para todo el lote de una vez sobre los valores no nulos (sin densificar):
+        un gather por (fila, término), un lexsort y un corte por fila.
+        Retorna por fila una lista [[termino, aporte], ...] ordenada de mayor a menor.
+        """
+        if self.motor is not None and self.motor.featurizacion == 'hashing':
+            # El hash no se puede invertir: sin vocabulario no hay términos que mostrar
+            return [None] * len(filas)
+
+        largos, indices, valores = self._aplanar_filas(filas)
+        explicaciones = [[] for _ in range(len(filas))]
+        if not len(indices):
+            return explicaciones
+
+        c_texto, peso_texto = self._bloque_texto_centroides()
+        fila_de = np.repeat(np.arange(len(filas)), largos)
+        aporte = valores * peso_texto * c_texto[np.asarray(clusters)[fila_de], indices]
+
+        # Ordenar por fila y, dentro de cada fila, por aporte descendente
+        orden = np.lexsort((-aporte, fila_de))
+        fila_de, indices, aporte = fila_de[orden], indices[orden], aporte[orden]
+        posicion = np.arange(len(orden)) - np.searchsorted(fila_de, fila_de)
+        elegidos = (posicion < n) & (aporte > 0)
+
+        terminos = self._terminos_vocabulario()
+        for fila, idx, valor in zip(fila_de[elegidos].tolist(), indices[elegidos], np.round(aporte[elegidos], 4).tolist()):
+            explicaciones[fila].append([terminos[idx], valor])
+        return explicaciones
+
+    def _predecir_matriz(self, cant_rojos, cant_amarillos, textos):
+        """
+        Núcleo vectorizado: recibe N conteos de rojos/amarillos y N textos ya unidos,
+        y devuelve la lista de N niveles de riesgo.
+        """
+        X_texto = self._vectorizar_texto(textos)
+        return self._niveles(self._clusters(cant_rojos, cant_amarillos, X_texto))
+
+    def _distancias_centroides(self, X_colores, X_texto):
+        """
+        Distancia euclidiana al cuadrado de cada fila a cada centroide, shape (N, k),
+        sin armar la matriz densa [colores | texto * PESO_TEXTO]:
+
+            ||x - c||² = ||x||² - 2·x·c + ||c||²
+
+        X_colores es densa (N, 2) ya escalada y X_texto es CSR (N, vocab); el producto
+        contra los centroides se separa en ambos bloques.
+        """
+        centroides = self.cerebro['model'].cluster_centers_
+        n_colores = X_colores.shape[1]
+        c_colores = centroides[:, :n_colores]
+        c_texto = centroides[:, n_colores:]
+
+        producto = X_colores @ c_colores.T + PESO_TEXTO * np.asarray((X_texto @ c_texto.T))
+        norma_x = (X_colores ** 2).sum(axis=1) + (PESO_TEXTO ** 2) * np.asarray(
+            X_texto.multiply(X_texto).sum(axis=1)
+        ).ravel()
+        norma_c = (centroides ** 2).sum(axis=1)
+
+        distancias = norma_x[:, None] - 2 * producto + norma_c[None, :]
+        return np.maximum(distancias, 0)
+
+    # ── Feature store (tabla feature_estudiante) ─────────────────────────
+
+    @staticmethod
+    def _matriz_a_filas(X_texto):
+        """Matriz TF-IDF (densa o CSR) → lista de filas dispersas (indices, valores)."""
+        if hasattr(X_texto, 'tocsr'):
+            X_texto = X_texto.tocsr()
+            return [
+                (X_texto.indices[a:b].tolist(), X_texto.data[a:b].tolist())
+                for a, b in zip(X_texto.indptr[:-1], X_texto.indptr[1:])
+            ]
+        filas = []
+        for fila in X_texto:
+            nz = np.flatnonzero(fila)
+            filas.append((nz.tolist(), fila[nz].tolist()))
+        return filas
+
+    @staticmethod
+    def _aplanar_filas(filas):
+        """Filas dispersas (indices, valores) → (largos, indices, valores) concatenados (formato CSR)."""
+        largos = np.fromiter((len(indices) for indices, _ in filas), dtype=np.int64, count=len(filas))
+        total = int(largos.sum())
+        indices = np.fromiter((i for fila, _ in filas for i in fila), dtype=np.int64, count=total)
+        valores = np.fromiter((v for _, fila in filas for v in fila), dtype=np.float64, count=total)
+        return largos, indices, valores
+
+    def _filas_a_matriz(self, filas):
+        """Inverso de _matriz_a_filas, con el mismo tipo de matriz que _vectorizar_texto."""
+        n_filas, n_vocab = len(filas), self._n_vocabulario()
+        largos, indices, valores = self._aplanar_filas(filas)
+        indptr = np.concatenate([[0], np.cumsum(largos)]).astype(np.int64)
+
+        if self.motor is None and self.disperso:
+            from scipy import sparse
+            return sparse.csr_matrix((valores, indices, indptr), shape=(n_filas, n_vocab))
+
+        X = np.zeros((n_filas, n_vocab), dtype=np.float64)
+        X[np.repeat(np.arange(n_filas), largos), indices] = valores
+        return X
+
+    def _featurizar(self, ids):
+        """
+        Calcula desde la BD las features de `ids` (lista de pk) y las guarda en el feature store.
+        Retorna {pk: (cant_bitacoras, rojos, amarillos, (indices, valores))}.
+        """
+        # Las filas quedan selladas con el instante ANTES de leer: si una bitácora o comentario
+        # cambia mientras tanto, su marca de recálculo es posterior y la fila no se reutiliza
+        leido = timezone.now()
+        bitacoras_qs = Bitacora.objects.filter(estudiante_id__in=ids)
+
+        # 1. Conteos por estudiante en una sola consulta agregada
+        conteos = conteos_bitacoras(bitacoras_qs)
+
+        # 2. Textos: observación de cada bitácora y luego sus comentarios, en una consulta en streaming
+        textos = {pk: [] for pk in conteos}
+        for estudiante_id, textos_estudiante in iterar_textos_estudiantes(bitacoras_qs):
+            textos[estudiante_id] = textos_estudiante
+
+        # 3. Un solo transform para todos los documentos nuevos
+        con_bitacoras = [pk for pk in ids if pk in conteos]
+        vectores = {}
+        if con_bitacoras:
+            X_texto = self._vectorizar_texto([" ".join(textos[pk]) for pk in con_bitacoras])
+            vectores = dict(zip(con_bitacoras, self._matriz_a_filas(X_texto)))
+
+        features = {
+            pk: conteos.get(pk, (0, 0, 0)) + (vectores.get(pk, ([], [])),)
+            for pk in ids
+        }
+
+        if self.usar_feature_store and self.guardar_features:
+            self._guardar_features(features, leido)
+        return features
+
+    def _guardar_features(self, features, leido):
+        FeatureEstudiante.objects.filter(estudiante_id__in=list(features)).delete()
+        FeatureEstudiante.objects.bulk_create([
+            FeatureEstudiante(
+                estudiante_id=pk,
+                version_featurizacion=self.version_featurizacion,
+                cant_bitacoras=total,
+                cant_rojos=rojos,
+                cant_amarillos=amarillos,
+                vector_tfidf={'indices': vector[0], 'valores': vector[1]},
+                fecha_calculo=leido,
+            )
+            for pk, (total, rojos, amarillos, vector) in features.items()
+        ], batch_size=500, ignore_conflicts=True)  # Otro proceso pudo guardarlas en paralelo
+
+    def _cargar_features(self, ids):
+        """
+        Features vigentes ya guardadas para `ids`: misma featurización y calculadas después
+        del último cambio del estudiante (su marca de recálculo, si tiene).
+        """
+        if not self.usar_feature_store:
+            return {}
+        return {
+            pk: (total, rojos, amarillos, (vector.get('indices', []), vector.get('valores', [])))
+            for pk, total, rojos, amarillos, vector in FeatureEstudiante.objects.filter(
+                estudiante_id__in=ids, version_featurizacion=self.version_featurizacion
+            ).exclude(
+                # Un cambio guardado mientras se calculaban (la señal no tenía fila que borrar)
+                estudiante__marca_recalculo__fecha_marca__gt=F('fecha_calculo')
+            ).values_list('estudiante_id', 'cant_bitacoras', 'cant_rojos', 'cant_amarillos', 'vector_tfidf')
+        }
+
+    def features_lote(self, ids):
+        """
+        {id_estudiante: (total, rojos, amarillos, (indices, valores))} de los ids dados:
+        lo vigente sale del feature store y solo lo que falta se vectoriza desde la BD.
+        """
+        features = self._cargar_features(ids)
+        pendientes = [pk for pk in ids if pk not in features]
+        if pendientes:
+            features.update(self._featurizar(pendientes))
+        return features
+
+    def matriz_ponderada(self, ids):
+        """
+        (ids con bitácoras, X) con X = [numéricas escaladas | TF-IDF] * pesos, el mismo espacio
+        de los centroides del artefacto. Solo con el motor NumPy (lo usan los comandos que
+        actualizan el modelo desde la BD).
+        """
+        if self.motor is None:
+            raise ValueError("matriz_ponderada requiere el artefacto compacto (.npz/.json).")
+        features = self.features_lote(ids)
+        con_bitacoras = [pk for pk in ids if features[pk][0] > 0]
+        rojos_input, amarillos_input = self._entradas_colores(
+            [features[pk][1] for pk in con_bitacoras],
+            [features[pk][2] for pk in con_bitacoras],
+        )
+        X_num = self.motor.matriz_numerica(rojos_input, amarillos_input)
+        X_texto = self._filas_a_matriz([features[pk][3] for pk in con_bitacoras])
+        return con_bitacoras, self.motor.matriz_final(X_num, X_texto)
+
+    # ── Predicción ──────────────────────────────────────────────────────
 
     def predecir_estudiante(self, estudiante_obj):
         if not self.cerebro: 
             return 0 
-        
-        bitacoras = estudiante_obj.bitacora_set.prefetch_related('comentarios').all()
-        
+
         # EL GHOSTING: Si no hay bitácoras, es un fantasma. Riesgo -1 (Alerta de Inactividad)
-        if not bitacoras.exists():
-            return -1
-
-        cant_rojos = 0
-        cant_amarillos = 0
-        textos = []
-
-        for b in bitacoras:
-            if b.estado_atencion == 3: cant_rojos += 1
-            elif b.estado_atencion == 2: cant_amarillos += 1
-            if b.observacion: textos.append(b.observacion)
-            for comentario in b.comentarios.all():
-                if comentario.texto: textos.append(comentario.texto)
-        
-        obs_limpia = self.limpiar_texto(" ".join(textos))
+        pk = estudiante_obj.pk
+        return self.predecir_lote(Estudiante.objects.filter(pk=pk)).get(pk, -1)
 
-        # CLIPPING
-        rojos_input = min(cant_rojos, 5)     
-        amarillos_input = min(cant_amarillos, 5) 
-        
-        # EL TERCER DATO
-        riesgo_score = (rojos_input * 3) + (amarillos_input * 1)
+    def predecir_lote(self, estudiantes_qs):
+        """
+        Versión vectorizada de predecir_estudiante para un queryset completo de Estudiante.
+        Retorna {id_estudiante: nivel}. Los estudiantes sin bitácoras quedan en -1 (ghosting).
+        """
+        return {pk: detalle[0] for pk, detalle in self.predecir_lote_detalle(estudiantes_qs).items()}
+
+    def predecir_lote_detalle(self, estudiantes_qs):
+        """
+        Como predecir_lote, pero retorna {id_estudiante: (nivel, confianza, nivel_alternativo, terminos)}
+        (ver _detalle). Los fantasmas quedan en (-1, None, None, None). Un error al predecir el
+        lote se propaga: no se confunde con "Sin contacto" (ver iterar_predicciones).
 
+        En vez de N consultas y N predicciones hace:
+          1. Lee del feature store las features vigentes del lote.
+          2. Solo para los que faltan (textos nuevos/editados): un GROUP BY para los conteos,
+             una consulta en streaming para los textos y un único tfidf.transform.
+          3. Una sola matriz de distancias (escalado + centroides) para todo el lote.
+        """
+        ids = list(estudiantes_qs.order_by().values_list('pk', flat=True))
+        if not ids:
+            return {}
+
+        if not self.cerebro:
+            return {pk: (0, None, None, None) for pk in ids}
+
+        resultado = {pk: (-1, None, None, None) for pk in ids}
         try:
-            # 1. Escalar numéricos (EL ORDEN EXACTO EXIGIDO POR LA IA)
-            X_colores_df = pd.DataFrame(
-                [[rojos_input, amarillos_input]], 
-                columns=['rojos_topados', 'amarillos_topados']
+            features = self.features_lote(ids)
+
+            # EL GHOSTING: sin bitácoras → -1
+            con_bitacoras = [pk for pk in ids if features[pk][0] > 0]
+            if not con_bitacoras:
+                return resultado
+
+            filas = [features[pk][3] for pk in con_bitacoras]
+            X_texto = self._filas_a_matriz(filas)
+            distancias = self._distancias(
+                [features[pk][1] for pk in con_bitacoras],
+                [features[pk][2] for pk in con_bitacoras],
+                X_texto,
             )
-            X_colores = self.cerebro['scaler'].transform(X_colores_df)
-            
-            # 2. Vectorizar texto
-            X_texto = self.cerebro['tfidf'].transform([obs_limpia]).toarray()
+        except Exception as e:
+            print(f"Error en predicción por lote ({len(ids)} estudiantes): {e}")
+            raise
+
+        resultado.update(zip(con_bitacoras, self._detalle(distancias, filas)))
+        return resultado
+
+    def iterar_predicciones(self, estudiantes_qs, tamano_bloque=TAMANO_BLOQUE):
+        """
+        Recorre estudiantes_qs en bloques de `tamano_bloque` ordenados por pk y entrega
+        tuplas (estudiante, nuevo_riesgo) usando predecir_lote_detalle en cada bloque.
+
+        Además deja en cada instancia (sin guardar) confianza_ia, nivel_riesgo_ia_alternativo y
+        terminos_ia; quien guarda debe incluir CAMPOS_DETALLE_IA en update_fields o usar guardar_detalle_ia.
+
+        Si la predicción de un bloque falla, sus estudiantes salen con nuevo_riesgo=None:
+        quien llama no debe guardarlos (ni limpiar sus marcas) y los cuenta como error.
+        """
+        ids = list(estudiantes_qs.order_by('pk').values_list('pk', flat=True))
+        for inicio in range(0, len(ids), tamano_bloque):
+            bloque_qs = estudiantes_qs.filter(pk__in=ids[inicio:inicio + tamano_bloque]).order_by('pk')
+            try:
+                detalles = self.predecir_lote_detalle(bloque_qs)
+            except Exception:
+                # Ya quedó informado en predecir_lote_detalle; el resto de los bloques sigue
+                for estudiante in bloque_qs:
+                    yield estudiante, None
+                continue
+            for estudiante in bloque_qs:
+                (nivel, estudiante.confianza_ia, estudiante.nivel_riesgo_ia_alternativo,
+                 estudiante.terminos_ia) = detalles.get(estudiante.pk, (-1, None, None, None))
+                yield estudiante, nivel
+
+
+def comparar_predictores(actual, candidato, ids):
+    """
+    Niveles de `ids` con dos modelos sobre los mismos datos, sin escribir nada en la BD.
+    Retorna {id_estudiante: (nivel_actual, nivel_candidato)}; sin bitácoras → (-1, -1).
+
+    Las bitácoras se leen una sola vez (un GROUP BY y una consulta en streaming) y los textos
+    se normalizan una vez; cada modelo solo hace su transform y su matriz de distancias, así
+    funciona aunque el candidato tenga otro vocabulario o featurización. No usa el feature
+    store: sus vectores son del modelo en uso.
+    """
+    bitacoras_qs = Bitacora.objects.filter(estudiante_id__in=ids)
+    conteos = conteos_bitacoras(bitacoras_qs)
+    textos = dict(iterar_textos_estudiantes(bitacoras_qs))
+
+    resultado = {pk: (-1, -1) for pk in ids}
+    con_bitacoras = [pk for pk in ids if pk in conteos]
+    if not con_bitacoras:
+        return resultado
+
+    rojos = [conteos[pk][1] for pk in con_bitacoras]
+    amarillos = [conteos[pk][2] for pk in con_bitacoras]
+    obs_limpias = normalizar_lote(" ".join(textos.get(pk, [])) for pk in con_bitacoras)
+
+    niveles = [
+        predictor._niveles(predictor._clusters(
+            rojos, amarillos, predictor._vectorizar_texto(obs_limpias, normalizados=True)
+        ))
+        for predictor in (actual, candidato)
+    ]
+    resultado.update(zip(con_bitacoras, zip(*niveles)))
+    return resultado
+
 
-            # 3. Concatenar (Debe ser idéntico al entrenamiento: colores x 1.0, texto x 1.5)
-            X_final = np.concatenate([X_colores, X_texto * 1.5], axis=1)
+def guardar_riesgos_lote(cambios, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Guarda en bloque los nuevos niveles calculados por la IA, sin un save() por estudiante.
 
-            # 4. Predecir
-            cluster_id = self.cerebro['model'].predict(X_final)[0]
-            riesgo_real = self.cerebro['mapa_orden'][cluster_id]
-            
-            return riesgo_real
+    `cambios` es una lista de tuplas (estudiante, nuevo_riesgo), solo con estudiantes
+    cuyo nivel cambió (tal como salen de iterar_predicciones, con CAMPOS_DETALLE_IA ya
+    cargados). Reproduce lo que hacen las señales en el flujo normal del recálculo:
+      - registrar_historial_riesgo → un HistorialRiesgo por cambio (bulk_create).
+      - notificar_prediccion_pendiente → notificación a los EC si quedó pendiente de validación.
+    El riesgo_anterior es el valor leído junto con el estudiante (no se vuelve a consultar).
 
+    No cubre la corrección manual del EC (riesgo_pendiente_validacion + riesgo_sobrescrito):
+    ese flujo sigue pasando por save() y la señal.
+    """
+    estudiantes = []
+    historiales = []
+    for estudiante, nuevo_riesgo in cambios:
+        origen = 'HU' if estudiante.riesgo_sobrescrito else 'ML'
+        historiales.append(HistorialRiesgo(
+            estudiante=estudiante,
+            riesgo_anterior=estudiante.nivel_riesgo_ia,
+            riesgo_nuevo=nuevo_riesgo,
+            origen_cambio=origen,
+            usuario_id=estudiante.riesgo_corregido_por_id if origen == 'HU' else None
+        ))
+        estudiante.nivel_riesgo_ia = nuevo_riesgo
+        estudiantes.append(estudiante)
+
+    with transaction.atomic():
+        Estudiante.objects.bulk_update(estudiantes, ['nivel_riesgo_ia'] + CAMPOS_DETALLE_IA, batch_size=tamano_bloque)
+        HistorialRiesgo.objects.bulk_create(historiales, batch_size=tamano_bloque)
+        notificar_predicciones_pendientes_lote(estudiantes)
+
+
+def guardar_detalle_ia(estudiantes, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Guarda solo CAMPOS_DETALLE_IA (bulk_update, sin señales ni historial) de estudiantes
+    cuyo nivel no cambió: la confianza y los términos se mueven aunque el nivel se mantenga.
+    """
+    Estudiante.objects.bulk_update(estudiantes, CAMPOS_DETALLE_IA, batch_size=tamano_bloque)
+
+
+def _firma_archivo(path):
+    """Firma barata de un archivo (mtime + tamaño). None si el archivo no existe."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _firma_modelo():
+    """Firma conjunta del .pkl y del artefacto compacto: cambia si cualquiera se reemplaza."""
+    return (
+        _firma_archivo(RUTA_MODELO),
+        _firma_archivo(RUTA_ARTEFACTO + '.npz'),
+        _firma_archivo(RUTA_ARTEFACTO + '.json'),
+    )
+
+
+def obtener_predictor():
+    """
+    Retorna el PredictorRiesgo compartido por el proceso (worker de gunicorn).
+
+    El modelo se carga una sola vez; en cada llamada solo se hace un os.stat de los archivos.
+    Si el archivo cambió (nuevo entrenamiento), se carga un predictor nuevo y se
+    reemplaza la referencia de una sola vez: quien ya tenía el anterior lo sigue
+    usando completo, nunca ve un modelo a medio cargar.
+    """
+    global _registro_predictor
+
+    predictor, firma = _registro_predictor
+    if predictor is not None and predictor.cerebro and _firma_modelo() == firma:
+        return predictor
+
+    with _registro_lock:
+        # Otro hilo pudo haberlo recargado mientras esperábamos el lock
+        predictor, firma = _registro_predictor
+        firma_actual = _firma_modelo()
+        if predictor is not None and predictor.cerebro and firma_actual == firma:
+            return predictor
+
+        # La firma se toma ANTES de cargar: si el archivo cambia durante la carga,
+        # la próxima llamada detecta la diferencia y vuelve a cargar.
+        nuevo = PredictorRiesgo(directorio_mmap=RUTA_MMAP)
+        _registro_predictor = (nuevo, firma_actual)
+        return nuevo
+
+
+def precargar_modelo():
+    """
+    Carga el predictor compartido en el proceso maestro de gunicorn, antes del fork
+    (preload_app + hook when_ready en gunicorn-cfg.py). Cada worker hereda el modelo ya
+    cargado (copy-on-write) y los arreglos mapeados en memoria, en vez de cargarlo en su
+    primera petición. Retorna el predictor.
+    """
+    predictor = obtener_predictor()
+    if predictor.cerebro:
+        # Estructuras derivadas (vocabulario inverso, tokenizador) armadas antes del fork
+        predictor._terminos_vocabulario()
+        predictor._vectorizar_texto(["precarga del modelo"])
+    return predictor
+
+
+class _SolicitudPrediccion:
+    __slots__ = ('estudiante_id', 'listo', 'detalle', 'error')
+
+    def __init__(self, estudiante_id):
+        self.estudiante_id = estudiante_id
+        self.listo = threading.Event()
+        self.detalle = None
+        self.error = None
+
+
+class CoalescedorPredicciones:
+    """
+    Junta los recálculos individuales que llegan casi al mismo tiempo (varios EC apretando
+    "recalcular" en distintos estudiantes) y los resuelve con un solo predecir_lote.
+
+    No usa hilos propios: el primer request que llega pasa a ser el "líder", espera hasta
+    `ventana` segundos (o hasta juntar `lote_max` solicitudes), predice el lote completo y
+    despierta al resto con su resultado. Solo tiene efecto con workers de varios hilos
+    (gunicorn gthread, ver gunicorn-cfg.py); con un solo hilo el lote es de 1.
+    """
+
+    def __init__(self, ventana=VENTANA_COALESCEDOR, lote_max=LOTE_MAX_COALESCEDOR):
+        self.ventana = ventana
+        self.lote_max = lote_max
+        self._cond = threading.Condition()
+        self._cola = []
+        self._hay_lider = False
+
+    def predecir(self, estudiante_id):
+        solicitud = _SolicitudPrediccion(estudiante_id)
+        with self._cond:
+            self._cola.append(solicitud)
+            es_lider = not self._hay_lider
+            if es_lider:
+                self._hay_lider = True
+            elif len(self._cola) >= self.lote_max:
+                self._cond.notify_all()
+
+        if es_lider:
+            self._resolver_lote()
+        else:
+            solicitud.listo.wait()
+
+        if solicitud.error is not None:
+            raise solicitud.error
+        return solicitud.detalle
+
+    def _resolver_lote(self):
+        limite = time.monotonic() + self.ventana
+        with self._cond:
+            while len(self._cola) < self.lote_max:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+            # Los que lleguen después de este punto esperan al siguiente líder
+            lote, self._cola = self._cola, []
+            self._hay_lider = False
+
+        try:
+            ids = {s.estudiante_id for s in lote}
+            detalles = obtener_predictor().predecir_lote_detalle(Estudiante.objects.filter(pk__in=ids))
+            for s in lote:
+                s.detalle = detalles.get(s.estudiante_id, (-1, None, None, None))
         except Exception as e:
-            print(f"Error en predicción para {estudiante_obj.rut}: {e}")
-            return -1 # Fantasma o Error
\ No newline at end of file
+            for s in lote:
+                s.error = e
+        finally:
+            for s in lote:
+                s.listo.set()
+
+
+_coalescedor = CoalescedorPredicciones()
+
+
+def predecir_estudiante_coalescido(estudiante_id):
+    """
+    (nivel, confianza, nivel_alternativo, terminos) de un estudiante, agrupando su predicción
+    con las de requests concurrentes.
+    """
+    return _coalescedor.predecir(estudiante_id)
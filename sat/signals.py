@@ -2,7 +2,18 @@ from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.db.models import Q
 from django.contrib.auth.models import User
-from .models import Bitacora, Notificacion, Usuario, Rol, Estudiante, HistorialRiesgo
+from .models import Bitacora, ComentarioBitacora, Notificacion, Usuario, Rol, Estudiante, HistorialRiesgo, FeatureEstudiante, MarcaRecalculo
+
+
+def _ids_encargados():
+    """
+    Ids de los Usuario que reciben las notificaciones: Encargados de Carrera y Superusuarios
+    (por email). Una sola consulta, con los emails de superusuario como subconsulta.
+    """
+    return list(Usuario.objects.filter(
+        Q(rol__nombre='Encargado de Carrera') |
+        Q(email__in=User.objects.filter(is_superuser=True).values_list('email', flat=True))
+    ).distinct().values_list('pk', flat=True))
 
 
 @receiver(post_save, sender=Bitacora)
@@ -18,20 +29,19 @@ def notificar_observacion(sender, instance, created, **kwargs):
 
         # Si el autor es Tutor, notificar a los Encargados y Superusuarios
         if autor and autor.rol.nombre == 'Tutor':
-            encargados = Usuario.objects.filter(
-                Q(rol__nombre='Encargado de Carrera') | 
-                Q(email__in=User.objects.filter(is_superuser=True).values_list('email', flat=True))
-            )
             observacion_texto = instance.observacion if instance.observacion else "Sin detalle"
             mensaje = f"📝 {observacion_texto}"
 
-            for encargado in encargados:
-                Notificacion.objects.create(
-                    destinatario=encargado,
+            # Un solo INSERT para todos los destinatarios
+            Notificacion.objects.bulk_create([
+                Notificacion(
+                    destinatario_id=encargado_id,
                     actor=autor,
                     mensaje=mensaje,
                     estudiante_relacionado=estudiante
                 )
+                for encargado_id in _ids_encargados()
+            ])
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -44,6 +54,46 @@ def notificar_observacion(sender, instance, created, **kwargs):
 #     DESACTIVADO: genera un delay de ~15s. Reemplazado por batch nocturno.
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# SEÑALES: Invalidar el feature store del modelo IA (tabla feature_estudiante)
+# y marcar al estudiante para el batch incremental (tabla marca_recalculo).
+# Cualquier alta/edición/borrado de bitácora o comentario deja obsoletas las
+# features del estudiante; el próximo recálculo las vuelve a vectorizar.
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _marcar_estudiante_modificado(estudiante_id):
+    if estudiante_id is None:
+        return
+    FeatureEstudiante.objects.filter(estudiante_id=estudiante_id).delete()
+    MarcaRecalculo.marcar(estudiante_id)
+
+
+@receiver(post_save, sender=Bitacora)
+@receiver(post_delete, sender=Bitacora)
+def invalidar_features_bitacora(sender, instance, **kwargs):
+    # Si la bitácora cambió de estudiante (ver Bitacora.from_db), el anterior también pierde sus textos
+    for estudiante_id in {getattr(instance, '_estudiante_id_bd', None), instance.estudiante_id}:
+        _marcar_estudiante_modificado(estudiante_id)
+    instance._estudiante_id_bd = instance.estudiante_id
+
+
+@receiver(post_save, sender=ComentarioBitacora)
+@receiver(post_delete, sender=ComentarioBitacora)
+def invalidar_features_comentario(sender, instance, **kwargs):
+    # Si el comentario cambió de bitácora (ver ComentarioBitacora.from_db), se marcan ambos estudiantes
+    bitacoras = {getattr(instance, '_bitacora_id_bd', None), instance.bitacora_id} - {None}
+    for estudiante_id in set(Bitacora.objects.filter(pk__in=bitacoras).values_list('estudiante_id', flat=True)):
+        _marcar_estudiante_modificado(estudiante_id)
+    instance._bitacora_id_bd = instance.bitacora_id
+
+
+@receiver(post_save, sender=Estudiante)
+def marcar_estudiante_nuevo(sender, instance, created, **kwargs):
+    # Un estudiante recién creado nunca pasó por el modelo
+    if created:
+        MarcaRecalculo.marcar(instance.pk)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # SEÑAL: Historial de cambios de riesgo en Estudiante
 # ─────────────────────────────────────────────────────────────────────────────
@@ -53,19 +103,28 @@ def registrar_historial_riesgo(sender, instance, **kwargs):
     """
     Antes de guardar un Estudiante, si nivel_riesgo_ia cambia, registra en HistorialRiesgo.
     Detecta el origen: 'ML' (batch/recálculo IA) o 'HU' (corrección del EC).
+
+    Compara contra los valores recordados al cargar la instancia (Estudiante.valores_bd);
+    solo consulta la BD si no se conocen. Un save(update_fields=...) sin campos de riesgo
+    (datos socioeconómicos, tutor, etc.) no hace nada.
     """
     if not instance.pk:
         return
 
-    try:
-        estudiante_anterior = Estudiante.objects.get(pk=instance.pk)
-    except Estudiante.DoesNotExist:
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not set(update_fields) & set(Estudiante.CAMPOS_HISTORIAL_RIESGO):
         return
 
-    es_correccion_pendiente = estudiante_anterior.riesgo_pendiente_validacion and instance.riesgo_sobrescrito
+    anterior = instance.valores_bd()
+    if anterior is None:
+        anterior = Estudiante.objects.filter(pk=instance.pk).values(*Estudiante.CAMPOS_HISTORIAL_RIESGO).first()
+        if anterior is None:
+            return
+
+    es_correccion_pendiente = anterior['riesgo_pendiente_validacion'] and instance.riesgo_sobrescrito
 
     # ── Detectar cambio en nivel_riesgo_ia o corrección de predicción pendiente ──
-    if instance.nivel_riesgo_ia != estudiante_anterior.nivel_riesgo_ia or es_correccion_pendiente:
+    if instance.nivel_riesgo_ia != anterior['nivel_riesgo_ia'] or es_correccion_pendiente:
         if es_correccion_pendiente:
             # EC está corrigiendo/rechazando una predicción pendiente.
             # Modificamos el último historial ML para que refleje la corrección manual.
@@ -81,7 +140,7 @@ def registrar_historial_riesgo(sender, instance, **kwargs):
             else:
                 HistorialRiesgo.objects.create(
                     estudiante=instance,
-                    riesgo_anterior=estudiante_anterior.nivel_riesgo_ia,
+                    riesgo_anterior=anterior['nivel_riesgo_ia'],
                     riesgo_nuevo=instance.nivel_riesgo_ia,
                     origen_cambio='HU',
                     usuario=instance.riesgo_corregido_por
@@ -91,14 +150,14 @@ def registrar_historial_riesgo(sender, instance, **kwargs):
             origen = 'HU' if instance.riesgo_sobrescrito else 'ML'
             HistorialRiesgo.objects.create(
                 estudiante=instance,
-                riesgo_anterior=estudiante_anterior.nivel_riesgo_ia,
+                riesgo_anterior=anterior['nivel_riesgo_ia'],
                 riesgo_nuevo=instance.nivel_riesgo_ia,
                 origen_cambio=origen,
                 usuario=instance.riesgo_corregido_por if origen == 'HU' else None
             )
 
     # ── Detectar cambio en nivel_riesgo_manual (etiqueta de reentrenamiento) ─
-    manual_anterior = estudiante_anterior.nivel_riesgo_manual
+    manual_anterior = anterior['nivel_riesgo_manual']
     manual_nuevo = instance.nivel_riesgo_manual
 
     if manual_nuevo is not None and manual_nuevo != manual_anterior and instance.nivel_riesgo_ia == manual_nuevo:
@@ -111,6 +170,20 @@ def registrar_historial_riesgo(sender, instance, **kwargs):
 # SEÑAL HITL: Notificar a EC cuando hay predicciones pendientes de validación
 # ─────────────────────────────────────────────────────────────────────────────
 
+PREFIJO_PREDICCION_PENDIENTE = "🤖 Validación pendiente:"
+
+
+def _mensaje_prediccion_pendiente(estudiante):
+    nivel_nombre = {
+        -1: 'Sin Contacto', 0: 'Sin Riesgo', 1: 'Bajo', 2: 'Medio', 3: 'Alto'
+    }.get(estudiante.nivel_riesgo_ia, '?')
+
+    return (
+        f"{PREFIJO_PREDICCION_PENDIENTE} {estudiante.nombre} {estudiante.apellido} "
+        f"— Modelo lo agrupó en nivel \"{nivel_nombre}\". Confirmar o corregir."
+    )
+
+
 @receiver(post_save, sender=Estudiante)
 def notificar_prediccion_pendiente(sender, instance, **kwargs):
     """
@@ -118,39 +191,43 @@ def notificar_prediccion_pendiente(sender, instance, **kwargs):
     envía una notificación a todos los Encargados de Carrera.
 
     Evita duplicados: si ya existe una notificación no leída para este estudiante
-    con el mismo mensaje, no crea otra.
+    con el mismo mensaje, no crea otra. Es el lote de un solo estudiante: tres
+    consultas (destinatarios, duplicados y un bulk_create) sin importar cuántos
+    Encargados haya.
     """
-    if not instance.riesgo_pendiente_validacion:
-        return
+    notificar_predicciones_pendientes_lote([instance])
 
-    nivel_nombre = {
-        -1: 'Sin Contacto', 0: 'Sin Riesgo', 1: 'Bajo', 2: 'Medio', 3: 'Alto'
-    }.get(instance.nivel_riesgo_ia, '?')
 
-    mensaje = (
-        f"🤖 Validación pendiente: {instance.nombre} {instance.apellido} "
-        f"— Modelo lo agrupó en nivel \"{nivel_nombre}\". Confirmar o corregir."
-    )
+def notificar_predicciones_pendientes_lote(estudiantes):
+    """
+    Versión por lote de notificar_prediccion_pendiente, para los guardados con
+    bulk_update (que no disparan post_save). Mismo criterio de destinatarios y
+    de duplicados, pero con una consulta de duplicados y un solo bulk_create.
+    """
+    pendientes = [e for e in estudiantes if e.riesgo_pendiente_validacion]
+    if not pendientes:
+        return
 
     # Notificar a Encargados de Carrera y también a Superusuarios
-    encargados = Usuario.objects.filter(
-        Q(rol__nombre='Encargado de Carrera') | 
-        Q(email__in=User.objects.filter(is_superuser=True).values_list('email', flat=True))
-    ).distinct()
-
-    for encargado in encargados:
-        # Evitar notificaciones duplicadas: si ya hay una no leída para este estudiante, omitir
-        ya_existe = Notificacion.objects.filter(
-            destinatario=encargado,
-            estudiante_relacionado=instance,
-            leida=False,
-            mensaje__startswith="🤖 Validación pendiente:"
-        ).exists()
-
-        if not ya_existe:
-            Notificacion.objects.create(
-                destinatario=encargado,
-                actor=None,
-                mensaje=mensaje,
-                estudiante_relacionado=instance
-            )
+    encargados = _ids_encargados()
+    if not encargados:
+        return
+
+    ya_notificados = set(Notificacion.objects.filter(
+        destinatario__in=encargados,
+        estudiante_relacionado__in=pendientes,
+        leida=False,
+        mensaje__startswith=PREFIJO_PREDICCION_PENDIENTE
+    ).values_list('destinatario_id', 'estudiante_relacionado_id'))
+
+    Notificacion.objects.bulk_create([
+        Notificacion(
+            destinatario_id=encargado_id,
+            actor=None,
+            mensaje=_mensaje_prediccion_pendiente(estudiante),
+            estudiante_relacionado=estudiante
+        )
+        for estudiante in pendientes
+        for encargado_id in encargados
+        if (encargado_id, estudiante.pk) not in ya_notificados
+    ])
@@ -5,7 +5,7 @@ from .views import (
     DashboardView, ReporteEstudiantePDF, MisTutoriasView, tomar_asistencia, TutoriaCreateView, TutoriaUpdateView, TutoriaDeleteView,
     leer_notificacion, todas_notificaciones, marcar_notificaciones_leidas, eliminar_notificaciones, ReporteAsistenciaView,
     DetalleAsistenciaEstudianteView, sobrescribir_riesgo, eliminar_historial_riesgo,
-    recalcular_riesgo_estudiante, recalcular_riesgo_masivo, confirmar_prediccion_ia, rechazar_prediccion_ia,
+    recalcular_riesgo_estudiante, recalcular_riesgo_masivo, estado_recalculo_masivo, confirmar_prediccion_ia, rechazar_prediccion_ia,
     # Bloque 2: Admin CRUD
     AdminPanelView, AdminUsuarioListView, admin_usuario_create, admin_usuario_edit, admin_usuario_toggle,
     AdminCarreraListView, admin_carrera_create, admin_carrera_edit, admin_carrera_delete,
@@ -43,6 +43,7 @@ urlpatterns = [
     path('historial-riesgo/<int:pk>/eliminar/', eliminar_historial_riesgo, name='eliminar-historial-riesgo'),
     path('estudiantes/<int:pk>/recalcular-riesgo/', recalcular_riesgo_estudiante, name='recalcular-riesgo-estudiante'),
     path('recalcular-riesgo-masivo/', recalcular_riesgo_masivo, name='recalcular-riesgo-masivo'),
+    path('recalcular-riesgo-masivo/<int:pk>/estado/', estado_recalculo_masivo, name='estado-recalculo-masivo'),
     path('estudiantes/<int:pk>/confirmar-prediccion/', confirmar_prediccion_ia, name='confirmar-prediccion-ia'),
     path('estudiantes/<int:pk>/rechazar-prediccion/', rechazar_prediccion_ia, name='rechazar-prediccion-ia'),
 
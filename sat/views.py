@@ -2,8 +2,8 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.urls import reverse_lazy
-from django.db.models import Count, Q, Case, When, IntegerField
+from django.urls import reverse, reverse_lazy
+from django.db.models import Count, F, Q, Case, When, IntegerField
 from django.db import transaction
 from django.template.loader import render_to_string
 from django.http import HttpResponse, HttpResponseForbidden
@@ -16,7 +16,7 @@ from django.views.generic import ListView, DetailView, CreateView, UpdateView, D
 from .models import (
     Estudiante, Usuario, Bitacora, Estado, Carrera, TipoAlarma, Tutoria,
     Asistencia, Notificacion, HistorialRiesgo, Rol, TipoTutoria,
-    ClasificacionTutoria, TipoDesercion, Alarma
+    ClasificacionTutoria, TipoDesercion, Alarma, TrabajoRecalculo
 )
 from .forms import (
     BitacoraForm, TutoriaForm,
@@ -374,7 +374,10 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 
         # Estudiantes pendientes de validación IA (para el nuevo panel)
         if es_encargado or django_user.is_superuser:
-            context['pendientes_validacion'] = mis_estudiantes.filter(riesgo_pendiente_validacion=True).order_by('-id_estudiante')
+            # Primero los de menor confianza (más cerca de la frontera entre dos niveles)
+            context['pendientes_validacion'] = mis_estudiantes.filter(riesgo_pendiente_validacion=True).order_by(
+                F('confianza_ia').asc(nulls_last=True), '-id_estudiante'
+            )
         else:
             context['pendientes_validacion'] = None
 
@@ -1096,25 +1099,28 @@ def recalcular_riesgo_estudiante(request, pk):
     Recalcula el riesgo IA para UN estudiante específico de forma síncrona.
     Accesible para Tutores y Encargados de Carrera (y superusuarios).
     El resultado aparece inmediatamente en la página del estudiante.
+    Si varios usuarios recalculan a la vez, las predicciones se resuelven juntas
+    (ver services.CoalescedorPredicciones).
     """
-    from .services import PredictorRiesgo
+    from .services import obtener_predictor, predecir_estudiante_coalescido, CAMPOS_DETALLE_IA
 
     estudiante = get_object_or_404(Estudiante, pk=pk)
 
     if request.method == 'POST':
         try:
-            predictor = PredictorRiesgo()
+            predictor = obtener_predictor()
             if not predictor.cerebro:
                 messages.error(request, '❌ El modelo IA no está disponible. Contacta al administrador.')
                 return redirect('estudiante-detail', pk=pk)
 
             riesgo_anterior = estudiante.nivel_riesgo_ia
-            nuevo_riesgo = predictor.predecir_estudiante(estudiante)
+            (nuevo_riesgo, estudiante.confianza_ia, estudiante.nivel_riesgo_ia_alternativo,
+             estudiante.terminos_ia) = predecir_estudiante_coalescido(estudiante.pk)
 
             if nuevo_riesgo != riesgo_anterior or estudiante.riesgo_sobrescrito:
                 # IA toma el control: actualiza nivel_riesgo_ia y marca como pendiente de validación
                 estudiante.nivel_riesgo_ia = nuevo_riesgo
-                campos = ['nivel_riesgo_ia', 'riesgo_pendiente_validacion']
+                campos = ['nivel_riesgo_ia', 'riesgo_pendiente_validacion'] + CAMPOS_DETALLE_IA
                 if nuevo_riesgo != riesgo_anterior:
                     estudiante.riesgo_pendiente_validacion = True   # EC debe confirmar este cambio
                 if estudiante.riesgo_sobrescrito:
@@ -1129,6 +1135,7 @@ def recalcular_riesgo_estudiante(request, pk):
                     f'⏳ Pendiente de confirmación por el Encargado de Carrera.'
                 )
             else:
+                estudiante.save(update_fields=CAMPOS_DETALLE_IA)
                 messages.info(request, f'ℹ️ El riesgo no cambió (sigue en nivel {riesgo_anterior}).')
 
         except Exception as e:
@@ -1140,85 +1147,79 @@ def recalcular_riesgo_estudiante(request, pk):
 @login_required
 def recalcular_riesgo_masivo(request):
     """
-    Recalcula el riesgo IA para TODOS los estudiantes o para una CARRERA específica.
+    Encola el recálculo del riesgo IA para TODOS los estudiantes o para una CARRERA específica.
     Solo accesible para Encargados de Carrera y superusuarios.
-    Muestra un resumen al terminar.
+    El trabajo lo ejecuta el comando procesar_trabajos_recalculo (fuera de gunicorn);
+    el dashboard sigue el avance con estado_recalculo_masivo.
     """
-    from .services import PredictorRiesgo
+    from django.http import JsonResponse
+
+    es_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
 
     # Seguridad: solo Encargados o superusuarios
-    try:
-        perfil = Usuario.objects.get(email=request.user.email)
-        if perfil.rol.nombre != 'Encargado de Carrera' and not request.user.is_superuser:
-            messages.error(request, '⛔ Solo los Encargados de Carrera pueden ejecutar el recálculo masivo.')
-            return redirect('home')
-    except Usuario.DoesNotExist:
-        if not request.user.is_superuser:
-            messages.error(request, '⛔ No tienes permisos.')
-            return redirect('home')
+    perfil = Usuario.objects.filter(email=request.user.email).select_related('rol').first()
+    if not request.user.is_superuser and (perfil is None or perfil.rol.nombre != 'Encargado de Carrera'):
+        if es_ajax:
+            return JsonResponse({'error': 'Sin permisos para ejecutar el recálculo masivo.'}, status=403)
+        messages.error(request, '⛔ Solo los Encargados de Carrera pueden ejecutar el recálculo masivo.')
+        return redirect('home')
 
     if request.method == 'POST':
         carrera_id = request.POST.get('carrera_id', '').strip()
 
         # Filtrar por carrera o tomar todos
         qs = Estudiante.objects.all()
+        carrera = None
         if carrera_id:
+            carrera = Carrera.objects.filter(id_carrera=carrera_id).first()
             qs = qs.filter(carrera__id_carrera=carrera_id)
-            scope_label = Carrera.objects.filter(id_carrera=carrera_id).values_list('nombre', flat=True).first() or 'Carrera desconocida'
-        else:
-            scope_label = 'todos los estudiantes'
 
-        total = qs.count()
-        if total == 0:
+        if not qs.exists():
+            if es_ajax:
+                return JsonResponse({'error': 'No se encontraron estudiantes con ese filtro.'}, status=400)
             messages.warning(request, '⚠️ No se encontraron estudiantes con ese filtro.')
             return redirect('home')
 
-        # Cargar modelo UNA vez
-        try:
-            predictor = PredictorRiesgo()
-            if not predictor.cerebro:
-                messages.error(request, '❌ El modelo IA no está disponible.')
-                return redirect('home')
-        except Exception as e:
-            messages.error(request, f'❌ Error al cargar el modelo: {e}')
-            return redirect('home')
+        # Si ya hay un trabajo en curso para el mismo alcance, se reutiliza en vez de duplicarlo
+        # (uno en 'EJ' de un worker muerto vuelve a la cola o queda en error, no se reutiliza colgado)
+        TrabajoRecalculo.liberar_vencidos()
+        trabajo = TrabajoRecalculo.objects.filter(carrera=carrera, estado__in=['PE', 'EJ']).first()
+        if trabajo is None:
+            trabajo = TrabajoRecalculo.objects.create(carrera=carrera, solicitado_por=perfil)
+
+        if es_ajax:
+            return JsonResponse({
+                'id': trabajo.pk,
+                'url_estado': reverse('estado-recalculo-masivo', args=[trabajo.pk]),
+            })
+        messages.info(request, f'⏳ Recálculo encolado (#{trabajo.pk}). Recibirás una notificación al terminar.')
 
-        actualizados = 0
-        sin_cambio = 0
-        errores = 0
+    return redirect('home')
 
-        for estudiante in qs.iterator():
-            try:
-                nuevo_riesgo = predictor.predecir_estudiante(estudiante)
-                hubo_cambio_riesgo = nuevo_riesgo != estudiante.nivel_riesgo_ia
-                tiene_override = estudiante.riesgo_sobrescrito
-
-                if hubo_cambio_riesgo or tiene_override:
-                    estudiante.nivel_riesgo_ia = nuevo_riesgo
-                    campos = ['nivel_riesgo_ia']
-                    if tiene_override:
-                        # La IA toma el control; la etiqueta manual queda preservada en nivel_riesgo_manual
-                        estudiante.riesgo_sobrescrito = False
-                        campos.append('riesgo_sobrescrito')
-                    estudiante.save(update_fields=campos)
-                    actualizados += 1
-                else:
-                    sin_cambio += 1
-            except Exception:
-                errores += 1
-
-        msg = (
-            f'🤖 Recálculo completado para {scope_label}: '
-            f'{total} estudiantes procesados — '
-            f'{actualizados} actualizados, {sin_cambio} sin cambio'
-        )
-        if errores:
-            msg += f', {errores} con error'
-        if actualizados > 0:
-            msg += f'. ⏳ {actualizados} estudiante(s) pendiente(s) de confirmación.'
-        messages.success(request, msg)
 
-    return redirect('home')
+@login_required
+def estado_recalculo_masivo(request, pk):
+    """Progreso (JSON) de un trabajo de recálculo masivo. Lo consulta el dashboard cada pocos segundos."""
+    from django.http import JsonResponse
+
+    perfil = Usuario.objects.filter(email=request.user.email).select_related('rol').first()
+    if not request.user.is_superuser and (perfil is None or perfil.rol.nombre != 'Encargado de Carrera'):
+        return JsonResponse({'error': 'Sin permisos.'}, status=403)
+
+    trabajo = get_object_or_404(TrabajoRecalculo.objects.select_related('carrera'), pk=pk)
+    return JsonResponse({
+        'id': trabajo.pk,
+        'estado': trabajo.estado,
+        'estado_display': trabajo.get_estado_display(),
+        'total': trabajo.total,
+        'procesados': trabajo.procesados,
+        'actualizados': trabajo.actualizados,
+        'sin_cambio': trabajo.sin_cambio,
+        'errores': trabajo.errores,
+        'porcentaje': round(100 * trabajo.procesados / trabajo.total) if trabajo.total else 0,
+        'terminado': trabajo.terminado,
+        'resumen': trabajo.resumen() if trabajo.terminado else '',
+    })
 
 
 @login_required